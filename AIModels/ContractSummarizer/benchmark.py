@@ -0,0 +1,95 @@
+from src.preprocessor import DocumentPreprocessor
+from src.classifier import ClauseClassifier
+from src.summarizer import ContractSummarizer
+from typing import Callable, Dict, List
+import argparse
+import json
+import time
+
+def timed(fn: Callable, repeat: int):
+    """Run fn `repeat` times; return its last result and the best wall time."""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+def benchmark_classifier(classifier: ClauseClassifier, clauses: List[Dict[str, str]], batch_size: int = 16,
+                         repeat: int = 3) -> Dict:
+    """Compare the per-clause loop with batched classification on the same clauses."""
+    texts = [clause["content"] for clause in clauses]
+    classifier.classify_clauses(texts[:1], batch_size)  # Warm-up
+
+    single, single_seconds = timed(lambda: [classifier.classify_clause(text) for text in texts], repeat)
+    batched, batched_seconds = timed(lambda: classifier.classify_clauses(texts, batch_size), repeat)
+
+    top = lambda scores: max(scores.items(), key=lambda x: x[1])[0]
+    return {
+        "clauses": len(texts),
+        "batch_size": batch_size,
+        "per_clause": {"seconds": round(single_seconds, 4),
+                       "clauses_per_second": round(len(texts) / single_seconds, 2) if single_seconds else None},
+        "batched": {"seconds": round(batched_seconds, 4),
+                    "clauses_per_second": round(len(texts) / batched_seconds, 2) if batched_seconds else None},
+        "speedup": round(single_seconds / batched_seconds, 2) if batched_seconds else None,
+        "same_types": all(top(a) == top(b) for a, b in zip(single, batched)),
+        "max_probability_diff": max((abs(a[k] - b[k]) for a, b in zip(single, batched) for k in a), default=0.0)
+    }
+
+def benchmark_summarizer(summarizer: ContractSummarizer, clauses: List[Dict], batch_size: int = 8,
+                         repeat: int = 3) -> Dict:
+    """Compare one generate call per clause with batched clause summaries."""
+    summarizer.summarize_texts([clauses[0]["content"]] if clauses else [], max_length=20)  # Warm-up
+
+    def per_clause():
+        summaries = []
+        for clause in clauses:
+            settings = summarizer.settings_for(clause["type"])
+            summaries.append(summarizer.summarize_text(clause["content"], **settings))
+        return summaries
+
+    def calls(fn):
+        before = summarizer.generate_calls
+        result, seconds = timed(fn, repeat)
+        return result, seconds, (summarizer.generate_calls - before) // repeat
+
+    summarizer.batch_size = batch_size
+    single, single_seconds, single_calls = calls(per_clause)
+    batched, batched_seconds, batched_calls = calls(lambda: summarizer.summarize_clauses(clauses))
+    return {
+        "clauses": len(clauses),
+        "batch_size": batch_size,
+        "per_clause": {"seconds": round(single_seconds, 4), "generate_calls": single_calls},
+        "batched": {"seconds": round(batched_seconds, 4), "generate_calls": batched_calls},
+        "speedup": round(single_seconds / batched_seconds, 2) if batched_seconds else None,
+        "same_summaries": single == batched
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Throughput of the contract analysis models')
+    parser.add_argument('input_file', help='Path to the contract file (PDF/TXT)')
+    parser.add_argument('--batch-size', type=int, default=16, help='Clauses per classifier batch')
+    parser.add_argument('--summary-batch-size', type=int, default=8, help='Clauses per generate call')
+    parser.add_argument('--skip-summarizer', action='store_true', help='Only benchmark the classifier')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per variant (best time is reported)')
+    parser.add_argument('--output', help='Also write the JSON report to this file')
+    args = parser.parse_args()
+
+    _, clauses = DocumentPreprocessor().process_document(args.input_file)
+    classifier = ClauseClassifier(batch_size=args.batch_size)
+    report = {"classifier": benchmark_classifier(classifier, clauses, args.batch_size, max(1, args.repeat))}
+    if not args.skip_summarizer:
+        important_clauses = classifier.identify_important_clauses(clauses)
+        report["summarizer"] = benchmark_summarizer(ContractSummarizer(batch_size=args.summary_batch_size),
+                                                    important_clauses, args.summary_batch_size, max(1, args.repeat))
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+    print(text)
+
+if __name__ == "__main__":
+    main()
@@ -5,17 +5,38 @@ from src.output_generator import OutputGenerator
 import argparse
 import os
 
+# Parse a TYPE=N pair such as "payment=60" into a clause type and its summary length
+def clause_length(spec):
+    clause_type, sep, length = spec.partition('=')
+    if not sep or not clause_type.strip() or not length.isdigit():
+        raise argparse.ArgumentTypeError(f"expected TYPE=N, got {spec!r}")
+    return clause_type.strip(), int(length)
+
 def main():
     # Parse command line arguments
     parser = argparse.ArgumentParser(description='Contract Summarization Tool')
     parser.add_argument('input_file', help='Path to the contract file (PDF/TXT)')
     parser.add_argument('--output-dir', default='output', help='Output directory for results')
+    parser.add_argument('--batch-size', type=int, default=16, help='Clauses classified per model call')
+    parser.add_argument('--summary-batch-size', type=int, default=8, help='Clauses summarized per generate call')
+    parser.add_argument('--num-beams', type=int, default=4, help='Beam count for summary generation')
+    parser.add_argument('--clause-max-length', metavar='TYPE=N', action='append', type=clause_length,
+                        help='Maximum summary length for one clause type (repeatable; default 100)')
+    parser.add_argument('--hierarchical', action='store_true',
+                        help='Summarize long contracts chunk by chunk instead of truncating at 1024 tokens')
+    parser.add_argument('--max-generate-calls', type=int, default=32,
+                        help='Cap on generate calls for a hierarchical executive summary')
+    parser.add_argument('--page-cache', default='page_cache', help='Directory caching extracted PDF page text')
+    parser.add_argument('--extract-workers', type=int, help='Processes extracting PDF pages (default: one per CPU)')
     args = parser.parse_args()
     
     # Initialize components
-    preprocessor = DocumentPreprocessor()
-    classifier = ClauseClassifier()
-    summarizer = ContractSummarizer()
+    preprocessor = DocumentPreprocessor(cache_dir=args.page_cache, workers=args.extract_workers)
+    classifier = ClauseClassifier(batch_size=args.batch_size)
+    summarizer = ContractSummarizer(batch_size=args.summary_batch_size, num_beams=args.num_beams,
+                                    clause_settings={clause_type: {"max_length": length}
+                                                     for clause_type, length in args.clause_max_length or []},
+                                    hierarchical=args.hierarchical, max_generate_calls=args.max_generate_calls)
     output_gen = OutputGenerator(args.output_dir)
     
     # Process document
@@ -29,6 +50,10 @@ def main():
     # Generate summaries
     print("Generating summaries...")
     summary_data = summarizer.summarize_contract(full_text, important_clauses)
+    if args.hierarchical:
+        for level in summarizer.last_summary_levels:
+            print(f"  level {level['level']}: {level['chunks']} chunk(s), {level['generate_calls']} generate call(s), "
+                  f"{level['seconds']:.2f}s")
     
     # Save outputs
     print("Saving results...")
@@ -36,6 +61,7 @@ def main():
     output_gen.save_json(summary_data, f"{base_filename}_summary.json")
     output_gen.create_word_report(summary_data, f"{base_filename}_report.docx")
     
+    preprocessor.close()
     print("Done! Results saved in:", args.output_dir)
 
 if __name__ == "__main__":
@@ -1,12 +1,15 @@
 from transformers import AutoTokenizer, AutoModelForSequenceClassification
 import torch
-from typing import Dict, List
+from typing import Dict, List, Optional
 import numpy as np
 
 class ClauseClassifier:
-    def __init__(self, model_name: str = "nlpaueb/legal-bert-base-uncased"):
-        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-        self.model = AutoModelForSequenceClassification.from_pretrained(model_name)
+    def __init__(self, model_name: str = "nlpaueb/legal-bert-base-uncased", batch_size: int = 16,
+                 local_files_only: bool = False):
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name, local_files_only=local_files_only)
+        self.model = AutoModelForSequenceClassification.from_pretrained(model_name, local_files_only=local_files_only)
+        self.model.eval()
+        self.batch_size = batch_size
         self.clause_types = [
             "jurisdiction",
             "indemnity",
@@ -16,30 +19,41 @@ class ClauseClassifier:
             "liability",
             "payment"
         ]
-        
+    
     def classify_clause(self, text: str) -> Dict[str, float]:
         """Classify a clause into predefined categories."""
-        inputs = self.tokenizer(text, return_tensors="pt", truncation=True, max_length=512)
+        return self.classify_clauses([text])[0]
+    
+    def classify_clauses(self, texts: List[str], batch_size: Optional[int] = None) -> List[Dict[str, float]]:
+        """Classify many clauses in length-sorted batches; results keep input order."""
+        if not texts:
+            return []
+        batch_size = batch_size or self.batch_size
+        encodings = self.tokenizer(texts, truncation=True, max_length=512)["input_ids"]
         
-        with torch.no_grad():
-            outputs = self.model(**inputs)
-            probs = torch.softmax(outputs.logits, dim=1)
-            
-        # Convert probabilities to dictionary
-        clause_scores = {
-            clause_type: float(prob)
-            for clause_type, prob in zip(self.clause_types, probs[0])
-        }
+        # Neighbouring clauses in length order form a batch, so little of each batch is padding
+        order = sorted(range(len(texts)), key=lambda i: len(encodings[i]))
+        results: List[Optional[Dict[str, float]]] = [None] * len(texts)
+        with torch.inference_mode():
+            for start in range(0, len(order), batch_size):
+                rows = order[start:start + batch_size]
+                inputs = self.tokenizer.pad({"input_ids": [encodings[i] for i in rows]}, return_tensors="pt")
+                probs = torch.softmax(self.model(**inputs).logits, dim=1)
+                for row, row_probs in zip(rows, probs):
+                    results[row] = {
+                        clause_type: float(prob)
+                        for clause_type, prob in zip(self.clause_types, row_probs)
+                    }
         
-        return clause_scores
+        return results
     
-    def identify_important_clauses(self, clauses: List[Dict[str, str]], threshold: float = 0.5) -> List[Dict]:
+    def identify_important_clauses(self, clauses: List[Dict[str, str]], threshold: float = 0.5,
+                                   batch_size: Optional[int] = None) -> List[Dict]:
         """Identify and categorize important clauses."""
         important_clauses = []
+        all_scores = self.classify_clauses([clause["content"] for clause in clauses], batch_size)
         
-        for clause in clauses:
-            scores = self.classify_clause(clause["content"])
-            
+        for clause, scores in zip(clauses, all_scores):
             # Get the highest scoring category
             max_category = max(scores.items(), key=lambda x: x[1])
             
@@ -50,5 +64,5 @@ class ClauseClassifier:
                     "type": max_category[0],
                     "confidence": max_category[1]
                 })
-                
+        
         return important_clauses
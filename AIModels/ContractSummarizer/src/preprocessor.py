@@ -1,18 +1,178 @@
 import pdfplumber
+from pdfminer.pdftypes import PDFObjRef, PDFStream, resolve1
 import re
-from typing import List, Dict, Union, Tuple
+from typing import List, Dict, Iterator, Optional, Union, Tuple
 import nltk
 from nltk.tokenize import sent_tokenize
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+
+# Pages handed to a worker process per task, and the fewest uncached pages worth starting the pool for
+PAGES_PER_TASK = 4
+PARALLEL_MIN_PAGES = 8
+
+# Bumped whenever page keys change, so entries stored under old keys are never read
+PAGE_CACHE_VERSION = 2
+
+def _extract_pages(file_path: str, page_numbers: List[int]) -> List[str]:
+    """Extract the text of some pages of a PDF (runs in a worker process); empty pages give ''."""
+    with pdfplumber.open(file_path) as pdf:
+        return [pdf.pages[n].extract_text() or "" for n in page_numbers]
+
+def _digest_object(digest, obj, seen: set):
+    """Feed a PDF object (streams, dictionaries, arrays, references) into digest, each indirect object once."""
+    if isinstance(obj, PDFObjRef):
+        if obj.objid in seen:
+            digest.update(b"<seen>")
+            return
+        seen.add(obj.objid)
+        obj = resolve1(obj)
+    if isinstance(obj, PDFStream):
+        _digest_object(digest, obj.attrs, seen)
+        digest.update(obj.get_data())
+    elif isinstance(obj, dict):
+        for key in sorted(obj, key=str):
+            if key == 'Parent':  # Back to the page tree, which says nothing about this page's text
+                continue
+            digest.update(f"/{key}".encode())
+            _digest_object(digest, obj[key], seen)
+    elif isinstance(obj, (list, tuple)):
+        for item in obj:
+            _digest_object(digest, item, seen)
+    else:
+        digest.update(repr(obj).encode())
+
+def _page_digest(page) -> Optional[str]:
+    """Hash everything a page's text comes from: its size and rotation, content streams and resources
+    (fonts with their ToUnicode maps, Form XObjects and their own resources), so an unchanged page
+    keeps its key in an edited file."""
+    try:
+        digest = hashlib.sha256(repr((page.bbox, page.page_obj.rotate)).encode())
+        seen: set = set()
+        _digest_object(digest, page.page_obj.contents, seen)
+        _digest_object(digest, page.page_obj.resources, seen)
+        return digest.hexdigest()
+    except Exception:
+        return None
 
 class DocumentPreprocessor:
-    def __init__(self):
-        nltk.download('punkt')
+    def __init__(self, nltk_data: Optional[str] = None, download: bool = True, cache_dir: Optional[str] = None,
+                 workers: Optional[int] = None):
+        self.cache_dir = cache_dir
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.last_read_stats: Dict = {}
+        self._pool = None
+        if nltk_data:
+            nltk.data.path.insert(0, nltk_data)
+        if download:
+            nltk.download('punkt', download_dir=nltk_data)
+        else:
+            # Offline: the tokenizer must already be on disk
+            nltk.data.find('tokenizers/punkt')
+    
+    def close(self):
+        """Shut down the page extraction processes."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+    
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: the parent may already hold torch threads, which forking can deadlock
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+    
+    @staticmethod
+    def file_hash(file_path: str) -> str:
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest()
+    
+    def _page_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"v{PAGE_CACHE_VERSION}", 'pages', f"{key}.txt")
+    
+    def _manifest_path(self, file_hash: str) -> str:
+        return os.path.join(self.cache_dir, f"v{PAGE_CACHE_VERSION}", 'documents', f"{file_hash}.json")
+    
+    def _read_cached(self, key: Optional[str]) -> Optional[str]:
+        if key is None:
+            return None
+        try:
+            with open(self._page_path(key), 'r', encoding='utf-8') as f:
+                return f.read()
+        except OSError:
+            return None
+    
+    def _write_cached(self, key: Optional[str], text: str):
+        if key is None:
+            return
+        path = self._page_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(f"{path}.tmp", path)
+    
+    def _page_keys(self, file_path: str) -> List[Optional[str]]:
+        """Cache key of every page: its content digest, or file hash and page number as a fallback."""
+        file_hash = self.file_hash(file_path) if self.cache_dir else None
+        if file_hash:
+            try:
+                with open(self._manifest_path(file_hash), 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                pass
         
+        with pdfplumber.open(file_path) as pdf:
+            if not file_hash:
+                return [None] * len(pdf.pages)
+            keys = [_page_digest(page) or f"{file_hash}-{n}" for n, page in enumerate(pdf.pages)]
+        os.makedirs(os.path.dirname(self._manifest_path(file_hash)), exist_ok=True)
+        with open(self._manifest_path(file_hash), 'w', encoding='utf-8') as f:
+            json.dump(keys, f)
+        return keys
+    
+    def iter_pdf_pages(self, file_path: str) -> Iterator[str]:
+        """Yield the text of each PDF page in order, extracting uncached pages in worker processes."""
+        t0 = time.perf_counter()
+        keys = self._page_keys(file_path)
+        cached = {n: text for n, text in ((n, self._read_cached(key)) for n, key in enumerate(keys)) if text is not None}
+        missing = [n for n in range(len(keys)) if n not in cached]
+        tasks = [missing[i:i + PAGES_PER_TASK] for i in range(0, len(missing), PAGES_PER_TASK)]
+        parallel = self.workers > 1 and len(missing) >= PARALLEL_MIN_PAGES
+        futures = [self._executor().submit(_extract_pages, file_path, task) for task in tasks] if parallel else []
+        task_of = {n: i for i, task in enumerate(tasks) for n in task}
+        
+        for n in range(len(keys)):
+            if n in cached:
+                yield cached[n]
+                continue
+            i = task_of[n]
+            if tasks[i][0] == n:
+                # First page of a task: wait for it (or extract it here) and cache all its pages
+                texts = futures[i].result() if parallel else _extract_pages(file_path, tasks[i])
+                for page, text in zip(tasks[i], texts):
+                    self._write_cached(keys[page], text)
+                    cached[page] = text
+            yield cached[n]
+        
+        self.last_read_stats = {
+            "pages": len(keys),
+            "cached": len(keys) - len(missing),
+            "extracted": len(missing),
+            "parallel": parallel,
+            "seconds": round(time.perf_counter() - t0, 4)
+        }
+    
     def read_document(self, file_path: str) -> str:
         """Read document content from PDF or TXT file."""
         if file_path.lower().endswith('.pdf'):
-            with pdfplumber.open(file_path) as pdf:
-                text = '\n'.join(page.extract_text() for page in pdf.pages)
+            text = '\n'.join(self.iter_pdf_pages(file_path))
         else:
             with open(file_path, 'r', encoding='utf-8') as f:
                 text = f.read()
@@ -1,37 +1,163 @@
 from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
 import torch
-from typing import Dict, List
+from typing import Dict, List, Optional
+import math
+import re
+import time
+
+# Summary lengths for clause summaries; clause_settings entries override them per clause type
+DEFAULT_CLAUSE_SETTINGS = {"max_length": 100, "min_length": 30}
+
+# Hierarchical executive summary: tokens per chunk (BART reads at most 1024 including special
+# tokens), summary length per chunk, and the default cap on generate calls for one document
+CHUNK_TOKENS = 1000
+CHUNK_SUMMARY_LENGTH = 120
+MAX_GENERATE_CALLS = 32
 
 class ContractSummarizer:
-    def __init__(self, model_name: str = "facebook/bart-large-cnn"):
-        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-        self.model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
-        
-    def summarize_text(self, text: str, max_length: int = 150, min_length: int = 30) -> str:
+    def __init__(self, model_name: str = "facebook/bart-large-cnn", batch_size: int = 8, num_beams: int = 4,
+                 clause_settings: Optional[Dict[str, Dict[str, int]]] = None, hierarchical: bool = False,
+                 chunk_tokens: int = CHUNK_TOKENS, max_generate_calls: int = MAX_GENERATE_CALLS,
+                 local_files_only: bool = False):
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name, local_files_only=local_files_only)
+        self.model = AutoModelForSeq2SeqLM.from_pretrained(model_name, local_files_only=local_files_only)
+        self.model.eval()
+        self.batch_size = batch_size
+        self.num_beams = num_beams
+        self.clause_settings = clause_settings or {}
+        self.hierarchical = hierarchical
+        self.chunk_tokens = chunk_tokens
+        self.max_generate_calls = max_generate_calls
+        self.generate_calls = 0
+        self.last_summary_levels: List[Dict] = []
+    
+    def summarize_text(self, text: str, max_length: int = 150, min_length: int = 30,
+                       num_beams: Optional[int] = None) -> str:
         """Generate a summary for the given text."""
-        inputs = self.tokenizer(text, return_tensors="pt", truncation=True, max_length=1024)
-        
-        summary_ids = self.model.generate(
-            inputs["input_ids"],
-            max_length=max_length,
-            min_length=min_length,
-            num_beams=4,
-            length_penalty=2.0,
-            early_stopping=True
-        )
-        
-        summary = self.tokenizer.decode(summary_ids[0], skip_special_tokens=True)
+        return self.summarize_texts([text], max_length, min_length, num_beams)[0]
+    
+    def summarize_texts(self, texts: List[str], max_length: int = 150, min_length: int = 30,
+                        num_beams: Optional[int] = None, batch_size: Optional[int] = None) -> List[str]:
+        """Summarize many texts with one generate call per length-sorted, padded batch."""
+        if not texts:
+            return []
+        batch_size = batch_size or self.batch_size
+        num_beams = num_beams or self.num_beams
+        encodings = self.tokenizer(texts, truncation=True, max_length=1024)["input_ids"]
+        
+        order = sorted(range(len(texts)), key=lambda i: len(encodings[i]))
+        summaries: List[Optional[str]] = [None] * len(texts)
+        with torch.inference_mode():
+            for start in range(0, len(order), batch_size):
+                rows = order[start:start + batch_size]
+                inputs = self.tokenizer.pad({"input_ids": [encodings[i] for i in rows]}, return_tensors="pt")
+                summary_ids = self.model.generate(
+                    inputs["input_ids"],
+                    attention_mask=inputs["attention_mask"],
+                    max_length=max_length,
+                    min_length=min_length,
+                    num_beams=num_beams,
+                    length_penalty=2.0,
+                    early_stopping=True
+                )
+                self.generate_calls += 1
+                for row, summary in zip(rows, self.tokenizer.batch_decode(summary_ids, skip_special_tokens=True)):
+                    summaries[row] = summary
+        
+        return summaries
+    
+    def split_chunks(self, text: str, chunk_tokens: Optional[int] = None) -> List[str]:
+        """Split text into chunks of at most chunk_tokens tokens, breaking between sentences."""
+        chunk_tokens = chunk_tokens or self.chunk_tokens
+        pieces = [piece.strip() for piece in re.split(r'(?<=[.!?;:])\s+|\n+', text) if piece.strip()]
+        if not pieces:
+            return []
+        lengths = [len(ids) for ids in self.tokenizer(pieces, add_special_tokens=False)["input_ids"]]
+        
+        chunks: List[str] = []
+        current: List[str] = []
+        used = 0
+        for piece, length in zip(pieces, lengths):
+            if current and used + length > chunk_tokens:
+                chunks.append(" ".join(current))
+                current, used = [], 0
+            if length > chunk_tokens:
+                # A single oversized sentence is cut on token boundaries
+                ids = self.tokenizer(piece, add_special_tokens=False)["input_ids"]
+                chunks.extend(self.tokenizer.decode(ids[i:i + chunk_tokens], skip_special_tokens=True)
+                              for i in range(0, len(ids), chunk_tokens))
+                continue
+            current.append(piece)
+            used += length
+        if current:
+            chunks.append(" ".join(current))
+        return chunks
+    
+    def summarize_long(self, text: str, max_length: int = 200, min_length: int = 30,
+                       max_generate_calls: Optional[int] = None) -> str:
+        """Map-reduce summary: summarize batched chunks level by level, then summarize the result."""
+        max_generate_calls = max_generate_calls or self.max_generate_calls
+        first_call = self.generate_calls
+        self.last_summary_levels = []
+        chunks = self.split_chunks(text)
+        
+        while len(chunks) > 1:
+            # Keep one call for the final summary; larger batches keep a level within the cap
+            remaining = max_generate_calls - (self.generate_calls - first_call) - 1
+            if remaining < 1:
+                break
+            batch_size = max(self.batch_size, math.ceil(len(chunks) / remaining))
+            start, calls = time.perf_counter(), self.generate_calls
+            summaries = self.summarize_texts(chunks, CHUNK_SUMMARY_LENGTH, min_length, batch_size=batch_size)
+            self.last_summary_levels.append({
+                "level": len(self.last_summary_levels) + 1,
+                "chunks": len(chunks),
+                "generate_calls": self.generate_calls - calls,
+                "seconds": round(time.perf_counter() - start, 4)
+            })
+            chunks = self.split_chunks(" ".join(summaries))
+        
+        # Whatever remains is summarized in one call (truncated if the call cap stopped the map steps)
+        start = time.perf_counter()
+        summary = self.summarize_text(" ".join(chunks), max_length, min_length)
+        self.last_summary_levels.append({
+            "level": len(self.last_summary_levels) + 1,
+            "chunks": len(chunks),
+            "generate_calls": 1,
+            "seconds": round(time.perf_counter() - start, 4)
+        })
         return summary
     
+    def settings_for(self, clause_type: str) -> Dict[str, int]:
+        """Generation settings for one clause type."""
+        return {**DEFAULT_CLAUSE_SETTINGS, "num_beams": self.num_beams, **self.clause_settings.get(clause_type, {})}
+    
+    def summarize_clauses(self, important_clauses: List[Dict]) -> List[str]:
+        """Summarize clauses batched together whenever their types share generation settings."""
+        groups: Dict[tuple, List[int]] = {}
+        for i, clause in enumerate(important_clauses):
+            settings = self.settings_for(clause["type"])
+            key = (settings["max_length"], settings["min_length"], settings["num_beams"])
+            groups.setdefault(key, []).append(i)
+        
+        summaries: List[Optional[str]] = [None] * len(important_clauses)
+        for (max_length, min_length, num_beams), rows in groups.items():
+            texts = [important_clauses[i]["content"] for i in rows]
+            for i, summary in zip(rows, self.summarize_texts(texts, max_length, min_length, num_beams)):
+                summaries[i] = summary
+        return summaries
+    
     def summarize_contract(self, full_text: str, important_clauses: List[Dict]) -> Dict:
         """Generate summaries for the full contract and important clauses."""
         # Generate executive summary
-        executive_summary = self.summarize_text(full_text, max_length=200)
+        if self.hierarchical:
+            executive_summary = self.summarize_long(full_text, max_length=200)
+        else:
+            executive_summary = self.summarize_text(full_text, max_length=200)
         
-        # Summarize each important clause
+        # Summarize the important clauses in batches
         clause_summaries = []
-        for clause in important_clauses:
-            summary = self.summarize_text(clause["content"], max_length=100)
+        for clause, summary in zip(important_clauses, self.summarize_clauses(important_clauses)):
             clause_summaries.append({
                 "type": clause["type"],
                 "heading": clause["heading"],
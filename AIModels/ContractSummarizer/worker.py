@@ -0,0 +1,298 @@
+from typing import Dict, Optional
+import argparse
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8766
+DEFAULT_CACHE_DIR = 'model_cache'
+CLASSIFIER_MODEL = "nlpaueb/legal-bert-base-uncased"
+SUMMARIZER_MODEL = "facebook/bart-large-cnn"
+
+def go_offline():
+    """Keep transformers and huggingface_hub off the network; must run before they are imported."""
+    os.environ["HF_HUB_OFFLINE"] = "1"
+    os.environ["TRANSFORMERS_OFFLINE"] = "1"
+
+def setup_cache(cache_dir: str = DEFAULT_CACHE_DIR, classifier_model: str = CLASSIFIER_MODEL,
+                summarizer_model: str = SUMMARIZER_MODEL) -> Dict:
+    """Download both models and the NLTK tokenizer into cache_dir; the only step that needs the network."""
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification, AutoModelForSeq2SeqLM
+    import nltk
+    
+    for name, model_name, model_class in (("classifier", classifier_model, AutoModelForSequenceClassification),
+                                          ("summarizer", summarizer_model, AutoModelForSeq2SeqLM)):
+        path = os.path.join(cache_dir, name)
+        AutoTokenizer.from_pretrained(model_name).save_pretrained(path)
+        model_class.from_pretrained(model_name).save_pretrained(path)
+    if not nltk.download('punkt', download_dir=os.path.join(cache_dir, 'nltk_data')):
+        raise RuntimeError("Could not download the NLTK punkt tokenizer.")
+    
+    manifest = {"classifier": classifier_model, "summarizer": summarizer_model, "created": time.time()}
+    with open(os.path.join(cache_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+class ContractWorker:
+    """Loads the preprocessor, classifier and summarizer once from a local cache and analyzes contracts."""
+    
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, output_dir: str = 'output', batch_size: int = 16,
+                 summary_batch_size: int = 8, hierarchical: bool = False,
+                 page_cache: Optional[str] = 'page_cache', extract_workers: Optional[int] = None):
+        self.cache_dir = cache_dir
+        self.output_dir = output_dir
+        self.batch_size = batch_size
+        self.summary_batch_size = summary_batch_size
+        self.hierarchical = hierarchical
+        self.page_cache = page_cache
+        self.extract_workers = extract_workers
+        self.status = "loading"
+        self.error: Optional[str] = None
+        self.started_at = time.time()
+        self.load_seconds: Optional[float] = None
+        self.jobs_done = 0
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+    
+    def start(self) -> threading.Thread:
+        """Load in a background thread so health checks answer while the models load."""
+        thread = threading.Thread(target=self._load, daemon=True)
+        thread.start()
+        return thread
+    
+    def _load(self):
+        t0 = time.perf_counter()
+        try:
+            if not os.path.exists(os.path.join(self.cache_dir, 'manifest.json')):
+                raise FileNotFoundError(f"No model cache in {self.cache_dir}; run 'python worker.py setup' first.")
+            go_offline()
+            from src.preprocessor import DocumentPreprocessor
+            from src.classifier import ClauseClassifier
+            from src.summarizer import ContractSummarizer
+            
+            self.preprocessor = DocumentPreprocessor(os.path.join(self.cache_dir, 'nltk_data'), download=False,
+                                                     cache_dir=self.page_cache, workers=self.extract_workers)
+            self.classifier = ClauseClassifier(os.path.join(self.cache_dir, 'classifier'), self.batch_size,
+                                               local_files_only=True)
+            self.summarizer = ContractSummarizer(os.path.join(self.cache_dir, 'summarizer'), self.summary_batch_size,
+                                                 hierarchical=self.hierarchical, local_files_only=True)
+            self.status = "ready"
+        except Exception as e:
+            self.status = "error"
+            self.error = str(e) or type(e).__name__
+        self.load_seconds = time.perf_counter() - t0
+        self._ready.set()
+    
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        self._ready.wait(timeout)
+        return self.status == "ready"
+    
+    def health(self) -> Dict:
+        health = {
+            "status": self.status,
+            "ready": self.status == "ready",
+            "uptime": round(time.time() - self.started_at, 3),
+            "load_seconds": None if self.load_seconds is None else round(self.load_seconds, 3),
+            "jobs_done": self.jobs_done
+        }
+        if self.error:
+            health["error"] = self.error
+        return health
+    
+    def analyze(self, input_file: str, output_dir: Optional[str] = None, save: bool = True,
+                timeout: Optional[float] = None) -> Dict:
+        """Run one contract through the warm pipeline; jobs run one at a time."""
+        if not self.wait_until_ready(timeout):
+            return {"error": f"Worker not ready ({self.status})."}
+        if not os.path.isfile(input_file):
+            return {"error": f"No such file: {input_file}"}
+        
+        with self._lock:
+            timings = {}
+            t0 = time.perf_counter()
+            self.preprocessor.last_read_stats = {}
+            full_text, clauses = self.preprocessor.process_document(input_file)
+            timings["preprocess"] = time.perf_counter() - t0
+            pages = self.preprocessor.last_read_stats
+            
+            t0 = time.perf_counter()
+            important_clauses = self.classifier.identify_important_clauses(clauses)
+            timings["classify"] = time.perf_counter() - t0
+            
+            t0 = time.perf_counter()
+            summary_data = self.summarizer.summarize_contract(full_text, important_clauses)
+            timings["summarize"] = time.perf_counter() - t0
+            
+            outputs = []
+            if save:
+                from src.output_generator import OutputGenerator
+                t0 = time.perf_counter()
+                output_gen = OutputGenerator(output_dir or self.output_dir)
+                base_filename = os.path.splitext(os.path.basename(input_file))[0]
+                output_gen.save_json(summary_data, f"{base_filename}_summary.json")
+                output_gen.create_word_report(summary_data, f"{base_filename}_report.docx")
+                outputs = [os.path.join(output_gen.output_dir, f"{base_filename}_summary.json"),
+                           os.path.join(output_gen.output_dir, f"{base_filename}_report.docx")]
+                timings["save"] = time.perf_counter() - t0
+            self.jobs_done += 1
+        
+        return {
+            "input_file": input_file,
+            "summary": summary_data,
+            "outputs": outputs,
+            "pages": pages,
+            "timings": {step: round(seconds, 4) for step, seconds in timings.items()}
+        }
+    
+    def handle(self, request) -> Dict:
+        """Dispatch one decoded JSON request."""
+        if not isinstance(request, dict):
+            return {"error": "Request must be a JSON object."}
+        op = request.get("op", "analyze")
+        if op == "health":
+            response = self.health()
+        elif op == "analyze":
+            if not request.get("input_file"):
+                response = {"error": "Missing 'input_file'."}
+            else:
+                response = self.analyze(request["input_file"], request.get("output_dir"),
+                                        bool(request.get("save", True)), request.get("timeout"))
+        else:
+            response = {"error": f"Unknown op '{op}'."}
+        if "id" in request:
+            response["id"] = request["id"]
+        return response
+    
+    def handle_line(self, line: str) -> Dict:
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError:
+            return {"error": "Invalid JSON request."}
+        try:
+            return self.handle(request)
+        except Exception as e:
+            return {"error": str(e) or type(e).__name__}
+
+class _LineHandler(socketserver.StreamRequestHandler):
+    """Line-delimited JSON over TCP: one request per line, one response per line."""
+    
+    def handle(self):
+        for raw in self.rfile:
+            line = raw.decode('utf-8').strip()
+            if not line:
+                continue
+            response = self.server.worker.handle_line(line)
+            self.wfile.write((json.dumps(response) + "\n").encode('utf-8'))
+            self.wfile.flush()
+
+class _ThreadingServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+def serve_socket(worker: ContractWorker, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+    with _ThreadingServer((host, port), _LineHandler) as server:
+        server.worker = worker
+        print(f"Contract worker listening on {host}:{port}", file=sys.stderr)
+        server.serve_forever()
+
+def serve_stdio(worker: ContractWorker, stdin=sys.stdin, stdout=sys.stdout):
+    for line in stdin:
+        line = line.strip()
+        if not line:
+            continue
+        stdout.write(json.dumps(worker.handle_line(line)) + "\n")
+        stdout.flush()
+
+class WorkerClient:
+    """Submits contracts to a running worker."""
+    
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, timeout: float = 600.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+    
+    def request(self, payload: Dict) -> Dict:
+        with socket.create_connection((self.host, self.port), timeout=self.timeout) as sock:
+            sock.sendall((json.dumps(payload) + "\n").encode('utf-8'))
+            with sock.makefile('r', encoding='utf-8') as reader:
+                line = reader.readline()
+        if not line:
+            raise ConnectionError("Contract worker closed the connection without replying.")
+        return json.loads(line)
+    
+    def health(self) -> Dict:
+        return self.request({"op": "health"})
+    
+    def analyze(self, input_file: str, output_dir: Optional[str] = None, save: bool = True) -> Dict:
+        # The worker may run from another directory, so paths are sent absolute
+        payload = {"op": "analyze", "input_file": os.path.abspath(input_file), "save": save}
+        if output_dir:
+            payload["output_dir"] = os.path.abspath(output_dir)
+        return self.request(payload)
+
+def main():
+    parser = argparse.ArgumentParser(description='Warm contract analysis worker')
+    sub = parser.add_subparsers(dest='command', required=True)
+    
+    setup = sub.add_parser('setup', help='Download the models and NLTK data into the local cache')
+    setup.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    setup.add_argument('--classifier-model', default=CLASSIFIER_MODEL)
+    setup.add_argument('--summarizer-model', default=SUMMARIZER_MODEL)
+    
+    serve = sub.add_parser('serve', help='Load everything once from the cache and analyze submitted contracts')
+    serve.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    serve.add_argument('--output-dir', default='output', help='Default output directory for results')
+    serve.add_argument('--batch-size', type=int, default=16, help='Clauses classified per model call')
+    serve.add_argument('--summary-batch-size', type=int, default=8, help='Clauses summarized per generate call')
+    serve.add_argument('--hierarchical', action='store_true', help='Map-reduce executive summaries')
+    serve.add_argument('--page-cache', default='page_cache', help='Directory caching extracted PDF page text')
+    serve.add_argument('--extract-workers', type=int, help='Processes extracting PDF pages (default: one per CPU)')
+    serve.add_argument('--stdio', action='store_true', help='Read JSON jobs from stdin instead of a socket')
+    serve.add_argument('--host', default=DEFAULT_HOST)
+    serve.add_argument('--port', type=int, default=DEFAULT_PORT)
+    
+    submit = sub.add_parser('submit', help='Send a contract to a running worker')
+    submit.add_argument('input_file', help='Path to the contract file (PDF/TXT)')
+    submit.add_argument('--output-dir', help='Output directory (default: the worker\'s)')
+    submit.add_argument('--host', default=DEFAULT_HOST)
+    submit.add_argument('--port', type=int, default=DEFAULT_PORT)
+    
+    health = sub.add_parser('health', help='Report whether a running worker is warm')
+    health.add_argument('--host', default=DEFAULT_HOST)
+    health.add_argument('--port', type=int, default=DEFAULT_PORT)
+    
+    args = parser.parse_args()
+    
+    if args.command == 'setup':
+        print(json.dumps(setup_cache(args.cache_dir, args.classifier_model, args.summarizer_model), indent=2))
+        return
+    
+    if args.command == 'serve':
+        worker = ContractWorker(args.cache_dir, args.output_dir, args.batch_size, args.summary_batch_size,
+                                args.hierarchical, args.page_cache, args.extract_workers)
+        worker.start()
+        if args.stdio:
+            serve_stdio(worker)
+        else:
+            serve_socket(worker, args.host, args.port)
+        return
+    
+    client = WorkerClient(args.host, args.port)
+    try:
+        if args.command == 'submit':
+            result = client.analyze(args.input_file, args.output_dir)
+        else:
+            result = client.health()
+        print(json.dumps(result, indent=2))
+        sys.exit(1 if result.get("error") or result.get("status") == "error" else 0)
+    except OSError as e:
+        print(json.dumps({"error": f"Contract worker unavailable: {e}"}))
+        sys.exit(2)
+
+if __name__ == "__main__":
+    main()
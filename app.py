@@ -1,12 +1,18 @@
+import argparse
+import contextlib
+import itertools
 import json
 import sys
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+from query_cache import QueryCache
+from lexical_index import BM25Index
+from query_rules import QueryRules
+from vector_index import QUANTIZED_TYPES, RESCORE_CANDIDATES, MultiVectorIndex, build_vector_index, top_k_indices
+from metrics import METRICS, configure_metrics_log, log_trace, trace
+from corpus_artifact import load_corpus_artifact, save_corpus_artifact
 import re
-import pickle
 import os
-from datetime import datetime
+import hashlib
 
 # Function to load IPC data from JSON file
 def load_ipc_data(filename='ipc.json'):
@@ -15,25 +21,47 @@ def load_ipc_data(filename='ipc.json'):
             data = json.load(f)
         return data
     except FileNotFoundError:
-        print(f"Error: File '{filename}' not found. Download from https://github.com/civictech-India/Indian-Law-Penal-Code-Json/blob/main/ipc.json")
+        print(f"Error: File '{filename}' not found. Download from https://github.com/civictech-India/Indian-Law-Penal-Code-Json/blob/main/ipc.json", file=sys.stderr)
         sys.exit(1)
     except json.JSONDecodeError:
-        print("Error: Invalid JSON format in ipc.json.")
+        print("Error: Invalid JSON format in ipc.json.", file=sys.stderr)
         sys.exit(1)
 
+# General stop words for legal context
+STOP_WORDS = ['a', 'an', 'the', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by', 'as',
+              'is', 'are', 'was', 'were', 'be', 'been', 'have', 'has', 'had', 'do', 'does', 'did', 'will',
+              'would', 'shall', 'should', 'may', 'might', 'can', 'could']
+
+# Cleaning patterns are compiled once; clean_text runs over every section and every query
+PUNCTUATION_RE = re.compile(r'[^\w\s]')
+NUMBERS_RE = re.compile(r'\d+')
+WHITESPACE_RE = re.compile(r'\s+')
+
+def compile_stop_words(words):
+    return re.compile(r'\b(' + '|'.join(re.escape(word) for word in words) + r')\b')
+
+STOP_WORDS_RE = compile_stop_words(STOP_WORDS)
+
 # Enhanced text cleaning for better embedding quality, handling diverse texts
 def clean_text(text):
     if not text or isinstance(text, float):
         return ""
     text = str(text).lower()
-    text = re.sub(r'[^\w\s]', ' ', text)  # Remove punctuation
-    text = re.sub(r'\d+', '', text)  # Remove numbers
-    # General stop words for legal context
-    stop_words = r'\b(a|an|the|and|or|but|in|on|at|to|for|of|with|by|as|is|are|was|were|be|been|have|has|had|do|does|did|will|would|shall|should|may|might|can|could)\b'
-    text = re.sub(stop_words, '', text)
-    text = re.sub(r'\s+', ' ', text).strip()
+    text = PUNCTUATION_RE.sub(' ', text)  # Remove punctuation
+    text = NUMBERS_RE.sub('', text)  # Remove numbers
+    text = STOP_WORDS_RE.sub('', text)
+    text = WHITESPACE_RE.sub(' ', text).strip()
     return text
 
+# Prepared texts are truncated to this many characters for model compatibility
+MAX_TEXT_CHARS = 512
+
+# Cleaned title and description of one section, untruncated
+def section_text(item):
+    title = clean_text(item.get('section_title', ''))
+    desc = clean_text(item.get('section_desc', ''))
+    return f"{title} {desc}".strip()
+
 # Preprocess and prepare data, excluding repealed sections
 def prepare_data(data):
     texts = []
@@ -42,26 +70,191 @@ def prepare_data(data):
         desc_lower = item.get('section_desc', '').lower()
         if 'repealed' in desc_lower:
             continue
-        title = clean_text(item.get('section_title', ''))
-        desc = clean_text(item.get('section_desc', ''))
-        text = f"{title} {desc}".strip()
-        if len(text) > 512:  # Truncate for model compatibility
-            text = text[:512]
+        text = section_text(item)
+        if len(text) > MAX_TEXT_CHARS:  # Truncate for model compatibility
+            text = text[:MAX_TEXT_CHARS]
         if text:
             texts.append(text)
             valid_sections.append(item)
     return texts, valid_sections
 
-# Load or compute BERT embeddings with timestamped cache
-def get_embeddings(texts, model, cache_file='embeddings.pkl'):
-    timestamp_cache = f"{cache_file}_{datetime.now().strftime('%Y%m%d')}"
-    if os.path.exists(timestamp_cache):
-        with open(timestamp_cache, 'rb') as f:
-            return pickle.load(f)
-    embeddings = model.encode(texts, show_progress_bar=True, convert_to_numpy=True)
-    with open(timestamp_cache, 'wb') as f:
-        pickle.dump(embeddings, f)
-    return embeddings
+# Characters repeated between consecutive segments of a long section
+SEGMENT_OVERLAP = 128
+
+# Split a cleaned text into word-aligned segments of at most `size` characters, each repeating
+# about `overlap` characters of the previous one; texts that fit come back as a single segment
+def segment_text(text, size=MAX_TEXT_CHARS, overlap=SEGMENT_OVERLAP):
+    if len(text) <= size:
+        return [text]
+    words = text.split()
+    segments = []
+    start = 0
+    while True:
+        end, length = start, -1
+        while end < len(words) and length + 1 + len(words[end]) <= size:
+            length += 1 + len(words[end])
+            end += 1
+        end = max(end, start + 1)  # A single overlong word still makes (a truncated) segment
+        segments.append(' '.join(words[start:end])[:size])
+        if end >= len(words):
+            return segments
+        back, kept = end, -1
+        while back > start + 1 and kept + 1 + len(words[back - 1]) <= overlap:
+            back -= 1
+            kept += 1 + len(words[back])
+        start = back
+
+# Segment every section; returns the segment texts, stored section by section, and offsets
+# such that segments offsets[i]:offsets[i + 1] belong to section i
+def prepare_segments(full_texts):
+    segments = []
+    offsets = [0]
+    for text in full_texts:
+        segments.extend(segment_text(text))
+        offsets.append(len(segments))
+    return segments, offsets
+
+# Bump when the store layout changes so old files are ignored rather than misread
+EMBEDDING_CACHE_VERSION = 2
+EMBEDDING_DTYPE = 'float32'
+
+# Content hash of a prepared section text; store rows are keyed on this
+def text_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+# One store per corpus and model: raw vectors in <corpus>/<model>.npy plus a small JSON header in <corpus>/<model>.json
+def embedding_store_paths(model_name, cache_dir='embedding_cache', corpus='ipc'):
+    slug = re.sub(r'[^\w.-]', '_', model_name)
+    base = os.path.join(cache_dir, re.sub(r'[^\w.-]', '_', corpus), slug)
+    return f"{base}.npy", f"{base}.json"
+
+# The compiled corpus lives next to its embedding stores: <cache_dir>/<corpus>/corpus.npz
+def corpus_artifact_path(corpus, cache_dir='embedding_cache'):
+    return os.path.join(cache_dir, re.sub(r'[^\w.-]', '_', corpus), 'corpus.npz')
+
+# Everything a compiled corpus depends on: the source file's bytes and the text cleaning rules
+# (including stop words installed from a --rules file)
+def corpus_fingerprint(filename):
+    with open(filename, 'rb') as f:
+        source_hash = hashlib.sha256(f.read()).hexdigest()
+    rules = [PUNCTUATION_RE.pattern, NUMBERS_RE.pattern, WHITESPACE_RE.pattern, STOP_WORDS_RE.pattern, MAX_TEXT_CHARS]
+    return {"source_sha256": source_hash, "cleaning_sha256": text_hash(json.dumps(rules))}
+
+# Load a corpus as (texts, valid_sections, text hashes, untruncated texts) from its compiled artifact,
+# compiling the JSON first when the artifact is missing or stale. Sections come back as a SectionTable.
+def load_compiled_corpus(name, filename, cache_dir='embedding_cache'):
+    path = corpus_artifact_path(name, cache_dir)
+    fingerprint = corpus_fingerprint(filename) if os.path.exists(filename) else None
+    if fingerprint is not None:
+        compiled = load_corpus_artifact(path, fingerprint)
+        if compiled is not None:
+            METRICS.inc('corpus_artifact_hits')
+            return compiled
+    
+    with METRICS.stage('load_ipc_data'):
+        data = load_ipc_data(filename)
+    with METRICS.stage('prepare_data'):
+        texts, valid_sections = prepare_data(data)
+        full_texts = [section_text(item) for item in valid_sections]
+    hashes = [text_hash(text) for text in texts]
+    try:
+        save_corpus_artifact(path, texts, valid_sections, hashes, fingerprint, full_texts)
+    except OSError as e:
+        print(f"Warning: Could not write corpus artifact '{path}': {e}", file=sys.stderr)
+        return texts, valid_sections, hashes, full_texts
+    METRICS.inc('corpus_artifact_builds')
+    return load_corpus_artifact(path, fingerprint)
+
+# Scale rows to unit length so cosine similarity becomes a plain dot product
+def normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=EMBEDDING_DTYPE)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+# Open the store for this model as a read-only memmap; returns (None, None) if missing or mismatched
+def load_embedding_store(model_name, cache_dir='embedding_cache', revision=None, dimension=None, corpus='ipc'):
+    npy_path, header_path = embedding_store_paths(model_name, cache_dir, corpus)
+    if not (os.path.exists(npy_path) and os.path.exists(header_path)):
+        return None, None
+    try:
+        with open(header_path, 'r', encoding='utf-8') as f:
+            header = json.load(f)
+        vectors = np.load(npy_path, mmap_mode='r')
+    except (OSError, ValueError) as e:
+        print(f"Warning: Ignoring unreadable embedding store '{npy_path}': {e}", file=sys.stderr)
+        return None, None
+    if header.get('version') != EMBEDDING_CACHE_VERSION:
+        return None, None
+    if header.get('model') != model_name or header.get('revision') != revision:
+        return None, None
+    if dimension is not None and header.get('dimension') != dimension:
+        print(f"Warning: Embedding store '{npy_path}' has dimension {header.get('dimension')}, "
+              f"model '{model_name}' produces {dimension}; re-encoding.", file=sys.stderr)
+        return None, None
+    if vectors.shape != (header.get('count'), header.get('dimension')) or vectors.dtype != header.get('dtype'):
+        print(f"Warning: Embedding store '{npy_path}' does not match its header; re-encoding.", file=sys.stderr)
+        return None, None
+    return header, vectors
+
+# Write vectors first and the header last, each atomically, so a torn write is never trusted
+def save_embedding_store(model_name, vectors, hashes, section_ids, cache_dir='embedding_cache', revision=None,
+                         corpus='ipc'):
+    npy_path, header_path = embedding_store_paths(model_name, cache_dir, corpus)
+    os.makedirs(os.path.dirname(npy_path), exist_ok=True)
+    vectors = np.ascontiguousarray(vectors, dtype=EMBEDDING_DTYPE)
+    header = {
+        'version': EMBEDDING_CACHE_VERSION,
+        'model': model_name,
+        'revision': revision,
+        'dimension': int(vectors.shape[1]),
+        'dtype': EMBEDDING_DTYPE,
+        'count': int(vectors.shape[0]),
+        'normalized': True,
+        'hashes': list(hashes),
+        'section_ids': [str(section_id) for section_id in section_ids]
+    }
+    with open(f"{npy_path}.tmp", 'wb') as f:
+        np.save(f, vectors)
+    os.replace(f"{npy_path}.tmp", npy_path)
+    with open(f"{header_path}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(header, f)
+    os.replace(f"{header_path}.tmp", header_path)
+
+# Load or compute L2-normalized embeddings, encoding only sections whose prepared text is not stored yet
+def get_embeddings(texts, model, model_name, cache_dir='embedding_cache', revision=None, section_ids=None,
+                   corpus='ipc', hashes=None):
+    dimension = model.get_sentence_embedding_dimension()
+    if section_ids is None:
+        section_ids = range(len(texts))
+    section_ids = [str(section_id) for section_id in section_ids]
+    if hashes is None:
+        hashes = [text_hash(text) for text in texts]
+    
+    header, stored = load_embedding_store(model_name, cache_dir, revision, dimension, corpus)
+    if header is not None and header['hashes'] == hashes and header['section_ids'] == section_ids:
+        METRICS.inc('embedding_store_hits')
+        return stored  # Zero-copy: rows already line up with texts
+    
+    rows = {h: i for i, h in enumerate(header['hashes'])} if header is not None else {}
+    missing = {}
+    for h, text in zip(hashes, texts):
+        if h not in rows and h not in missing:
+            missing[h] = text
+    
+    encoded = {}
+    if missing:
+        new_vectors = model.encode(list(missing.values()), show_progress_bar=True, convert_to_numpy=True)
+        if dimension is not None and new_vectors.shape[1] != dimension:
+            raise ValueError(f"Model '{model_name}' returned {new_vectors.shape[1]}-dim embeddings, expected {dimension}.")
+        encoded = dict(zip(missing, normalize_rows(new_vectors)))
+        METRICS.inc('sections_encoded', len(missing))
+    
+    # Only rows for the current corpus are kept, so edited sections do not pile up
+    vectors = np.stack([encoded[h] if h in encoded else stored[rows[h]] for h in hashes])
+    del stored  # Release the memmap so the file can be replaced (required on Windows)
+    save_embedding_store(model_name, vectors, hashes, section_ids, cache_dir, revision, corpus)
+    return load_embedding_store(model_name, cache_dir, revision, corpus=corpus)[1]
 
 # Broad keyword map for diverse scenarios, avoiding overfitting
 keyword_map = {
@@ -85,73 +278,581 @@ keyword_map = {
     r'cyber|hack|data': 'cheating electronic record breach trust section 403 406 420',
 }
 
-# Augment user input with legal keywords for better matching
-def augment_input(scenario):
+# keyword_map compiled into a single matcher; replaced wholesale by load_query_rules
+QUERY_RULES = QueryRules.from_keyword_map(keyword_map)
+
+# Swap in keyword rules (and optionally stop words) from an external JSON rules file.
+# Changing stop words changes the prepared section texts, so affected sections are re-encoded.
+def load_query_rules(path):
+    global QUERY_RULES, STOP_WORDS_RE
+    rules = QueryRules.load(path)
+    QUERY_RULES = rules
+    if rules.stop_words is not None:
+        STOP_WORDS_RE = compile_stop_words(rules.stop_words)
+    return rules
+
+# Augment user input with legal keywords and report the names of the rules that fired
+def augment_input_detailed(scenario, rules=None):
+    rules = rules or QUERY_RULES
     scenario_clean = clean_text(scenario)
-    augmented = scenario_clean
-    matched = False
-    for user_terms, legal_terms in keyword_map.items():
-        if re.search(user_terms, scenario_clean, re.IGNORECASE):
-            augmented += f" {legal_terms}"
-            matched = True
-    if not matched:
+    fired = rules.match(scenario_clean)
+    augmented = " ".join([scenario_clean] + [rules.legal_terms[i] for i in fired])
+    if not fired:
         augmented += " criminal offence ipc section"
     if len(augmented) > 512:
         augmented = augmented[:512]
-    return augmented.strip()
+    return augmented.strip(), [rules.names[i] for i in fired]
 
-# Process a single scenario and return top k matches
-def process_scenario(scenario, texts, valid_sections, model, embeddings, top_k=3, low_score_threshold=0.3):
-    if not scenario or len(scenario.strip()) < 5:
-        return {"error": "Please provide a scenario (at least 5 characters)."}
-    
-    augmented_scenario = augment_input(scenario)
-    scenario_vec = model.encode([augmented_scenario], convert_to_numpy=True)
-    similarities = cosine_similarity(scenario_vec, embeddings)[0]
-    
-    top_indices = np.argsort(similarities)[-top_k:][::-1]
-    
-    matches = []
-    for idx in top_indices:
-        score = similarities[idx]
-        match = {
-            'section': valid_sections[idx].get('Section', 'N/A'),
-            'chapter': valid_sections[idx].get('chapter_title', 'N/A').title(),
-            'title': valid_sections[idx].get('section_title', 'N/A'),
-            'description': valid_sections[idx].get('section_desc', 'N/A'),
-            'score': score
-        }
-        matches.append(match)
+# Augment user input with legal keywords for better matching
+def augment_input(scenario):
+    return augment_input_detailed(scenario)[0]
+
+LOW_CONFIDENCE_WARNING = "Note: Low confidence. Try including specific details or legal terms (e.g., 'negligent', 'assault', 'theft') for better results."
+
+# Public match dict for one section
+def section_match(item, score):
+    return {
+        'section': item.get('Section', 'N/A'),
+        'chapter': item.get('chapter_title', 'N/A').title(),
+        'title': item.get('section_title', 'N/A'),
+        'description': item.get('section_desc', 'N/A'),
+        'score': float(score)
+    }
+
+# Build the match dicts and low-confidence warning from ranked section indices and their scores.
+# Hybrid retrieval orders matches by fused_scores, which are reported next to the dense `score`;
+# the warning always looks at the best dense score, wherever it ranks.
+def build_result(top_indices, scores, valid_sections, low_score_threshold=0.3, fused_scores=None):
+    matches = [section_match(valid_sections[idx], score) for idx, score in zip(top_indices, scores)]
+    if fused_scores is not None:
+        for match, fused in zip(matches, fused_scores):
+            if fused is not None:
+                match['fused_score'] = float(fused)
     
     warning = ""
-    if matches[0]['score'] < low_score_threshold:
-        warning = "Note: Low confidence. Try including specific details or legal terms (e.g., 'negligent', 'assault', 'theft') for better results."
+    if max(match['score'] for match in matches) < low_score_threshold:
+        warning = LOW_CONFIDENCE_WARNING
+        METRICS.inc('low_confidence')
     
     return {
         "matches": matches,
         "warning": warning
     }
 
-# Main function to process a scenario
-def find_ipc_section(scenario, top_k=3):
-    data = load_ipc_data()
-    texts, valid_sections = prepare_data(data)
+# Encode augmented queries to unit vectors, consulting the query cache first so repeats skip the model
+def encode_queries(augmented, model, query_cache=None):
+    if query_cache is None:
+        return model.encode(augmented, convert_to_numpy=True, normalize_embeddings=True)
     
-    if not texts:
-        return {"error": "No valid data found in JSON."}
+    cached = query_cache.get_many(augmented)
+    missing = [query for query in dict.fromkeys(augmented) if query not in cached]
+    METRICS.inc('query_cache_hits', len(cached))
+    METRICS.inc('query_cache_misses', len(missing))
+    if missing:
+        encoded = model.encode(missing, convert_to_numpy=True, normalize_embeddings=True)
+        query_cache.put_many(zip(missing, encoded))
+        cached.update(zip(missing, encoded))
+    return np.stack([cached[query] for query in augmented])
+
+# Hybrid retrieval defaults: BM25 candidates per query, weight of the dense score in fusion, RRF damping
+BM25_CANDIDATES = 100
+FUSION_WEIGHT = 0.7
+RRF_K = 60
+
+# Fuse dense cosine and BM25 scores for one query's candidates (lexical arrives best first)
+def fuse_scores(dense, lexical, fusion='linear', weight=FUSION_WEIGHT):
+    if fusion == 'rrf':
+        dense_rank = np.empty(len(dense))
+        dense_rank[np.argsort(-dense, kind='stable')] = np.arange(len(dense))
+        lexical_rank = np.arange(len(lexical))
+        return weight / (RRF_K + dense_rank + 1) + (1 - weight) / (RRF_K + lexical_rank + 1)
+    return weight * dense + (1 - weight) * lexical / lexical[0]
+
+# BM25 picks candidates per query, then one matrix multiply scores the union of all candidates densely.
+# Each query gets (ids, dense scores, fused scores), ordered by the fused score.
+def hybrid_rank(augmented, scenario_vecs, vector_index, lexical_index, top_k, candidates=BM25_CANDIDATES,
+                fusion='linear', weight=FUSION_WEIGHT):
+    hits = [lexical_index.search(query.split(), max(candidates, top_k)) for query in augmented]
+    # Queries with fewer lexical hits than top_k fall back to scoring the whole corpus
+    if all(len(ids) >= top_k for ids, _ in hits):
+        union = np.unique(np.concatenate([ids for ids, _ in hits]))
+    else:
+        union = np.arange(len(vector_index))
+    dense = vector_index.score(scenario_vecs, union)
+    
+    ranked = []
+    for row, (ids, lexical) in enumerate(hits):
+        if len(ids) >= top_k:
+            row_dense = dense[row, np.searchsorted(union, ids)]
+            fused = fuse_scores(row_dense, lexical, fusion, weight)
+        else:
+            ids, row_dense = union, dense[row]
+            fused = row_dense
+        order = top_k_indices(fused[None, :], top_k)[0]
+        ranked.append((ids[order], row_dense[order], fused[order]))
+    return ranked
+
+# Rank one corpus for a batch of encoded queries: BM25 + dense rerank when a lexical index is
+# configured, otherwise the corpus vector index (exact flat search unless an ANN index was built)
+def rank_queries(augmented, scenario_vecs, embeddings, top_k, lexical_index=None, vector_index=None,
+                 candidates=BM25_CANDIDATES, fusion='linear', fusion_weight=FUSION_WEIGHT):
+    if vector_index is None:
+        vector_index = build_vector_index(embeddings)
+    if lexical_index is not None:
+        return hybrid_rank(augmented, scenario_vecs, vector_index, lexical_index, top_k, candidates,
+                           fusion, fusion_weight)
+    return vector_index.search(scenario_vecs, top_k)
+
+# Explicit section references: "section 302", "sections 302 and 304", "s. 498A", "u/s 302/34", "IPC 420",
+# or a scenario that is nothing but a section number ("is this 302?"). Lists joined by commas or
+# "and"/"or" need the plural keyword, so "section 302 and 3 others" names only 302; a singular
+# keyword takes slash-joined numbers only. An "IPC"/"BNS" prefix is captured so the reference only
+# resolves in the corpus of that name.
+SECTION_NUMBER = r'\d{1,3}[a-z]{0,2}'
+SECTION_REFERENCE_RE = re.compile(
+    rf'(?:\b(?:sections|secs\.?)\s*({SECTION_NUMBER}(?:\s*(?:,|/|&|\band\b|\bor\b)\s*{SECTION_NUMBER})*)'
+    rf'|(?:\b(?:section|sec\.?|u/s\.?|(ipc|bns))|(?<![\w.])s\.)\s*({SECTION_NUMBER}(?:\s*/\s*{SECTION_NUMBER})*))\b',
+    re.IGNORECASE)
+BARE_SECTION_RE = re.compile(rf'^\s*(?:(?:is|was)\s+(?:this|it|that)\s+)?({SECTION_NUMBER})\s*\??\s*$', re.IGNORECASE)
+SECTION_NUMBER_RE = re.compile(SECTION_NUMBER, re.IGNORECASE)
+
+# Sections a scenario names explicitly, in order of appearance, as (number, corpus) pairs: the
+# upper-cased section number and the lower-cased corpus named before it ("IPC 420"), or None
+def find_section_references(scenario):
+    groups = [(match.group(1) or match.group(3), match.group(2)) for match in SECTION_REFERENCE_RE.finditer(scenario)]
+    if not groups:
+        groups = [(match.group(1), None) for match in [BARE_SECTION_RE.match(scenario)] if match]
+    references = [(number.upper(), code.lower() if code else None)
+                  for group, code in groups for number in SECTION_NUMBER_RE.findall(group)]
+    return list(dict.fromkeys(references))
+
+# O(1) lookup tables for one corpus: section number -> row, and chapter number -> rows
+def build_section_lookup(valid_sections):
+    sections = {}
+    chapters = {}
+    for idx, item in enumerate(valid_sections):
+        sections.setdefault(str(item.get('Section', '')).strip().upper(), idx)
+        chapters.setdefault(str(item.get('chapter', '')).strip().upper(), []).append(idx)
+    return sections, chapters
+
+# The stored vector of one section (its first segment under --multi-vector)
+def section_vector(corpus, idx):
+    vector_index = corpus["options"].get("vector_index")
+    if isinstance(vector_index, MultiVectorIndex):
+        idx = vector_index.offsets[idx]
+    return np.asarray(corpus["embeddings"][idx], dtype=np.float32)
+
+# Answer a scenario that names sections directly, without the model: the referenced sections
+# (score 1.0) followed, if asked, by each one's nearest sections by stored embedding.
+# A reference naming a corpus ("IPC 420") is only looked up in that corpus, if it is searched.
+# Returns None when none of the referenced sections exist in the given corpora.
+def reference_result(references, corpora, neighbours=0):
+    found = [(c, corpus["section_lookup"][ref]) for ref, code in references
+             for c, corpus in enumerate(corpora)
+             if ref in corpus["section_lookup"] and (code is None or str(corpus["name"]).lower() == code)]
+    found = list(dict.fromkeys(found))
+    if not found:
+        return None
+    
+    hits = [(1.0, c, idx, None) for c, idx in found]
+    seen = set(found)
+    for c, idx in found if neighbours > 0 else []:
+        corpus = corpora[c]
+        vector_index = corpus["options"].get("vector_index") or build_vector_index(corpus["embeddings"])
+        ids, scores = vector_index.search(section_vector(corpus, idx)[None, :], neighbours + len(found))[0]
+        near = [(float(score), c, int(other), idx) for other, score in zip(ids, scores) if (c, int(other)) not in seen]
+        for hit in near[:neighbours]:
+            seen.add((hit[1], hit[2]))
+            hits.append(hit)
+    
+    matches = []
+    for score, c, idx, neighbour_of in hits:
+        match = section_match(corpora[c]["valid_sections"][idx], score)
+        if neighbour_of is None:
+            match["referenced"] = True
+        else:
+            match["neighbour_of"] = corpora[c]["valid_sections"][neighbour_of].get('Section', 'N/A')
+        if len(corpora) > 1:
+            match["corpus"] = corpora[c]["name"]
+        matches.append(match)
+    return {"matches": matches, "warning": ""}
+
+# Split out scenarios too short to analyse (a bare section number such as "302" is allowed through
+# for the section lookup); returns the result slots and indices still to process
+def validate_scenarios(scenarios):
+    results = [None] * len(scenarios)
+    batch = []
+    for i, scenario in enumerate(scenarios):
+        if not isinstance(scenario, str) or (len(scenario.strip()) < 5 and not BARE_SECTION_RE.match(scenario)):
+            results[i] = {"error": "Please provide a scenario (at least 5 characters)."}
+        else:
+            batch.append(i)
+    return results, batch
+
+# Cascade defaults: first-pass candidates handed to the larger model, and the top-1/top-2 score
+# margin below which the fast model's answer counts as a toss-up
+CASCADE_CANDIDATES = 20
+CASCADE_MARGIN = 0.05
+
+# Whether the fast model is unsure of a query's hits and the larger model should decide. Judged on
+# the best two dense scores, since hybrid retrieval orders hits by their fused score instead.
+def needs_escalation(hits, threshold, margin=CASCADE_MARGIN):
+    if not hits:
+        return False
+    scores = sorted((hit[0] for hit in hits), reverse=True)
+    return scores[0] < threshold or (len(scores) > 1 and scores[0] - scores[1] < margin)
+
+# Second cascade stage: queries the fast model is unsure of are encoded with the larger model and
+# only their first-pass candidates are rescored, against that model's own embedding index
+def cascade_rerank(augmented, hits_per_query, corpora, cascade, threshold):
+    escalated = [row for row, hits in enumerate(hits_per_query)
+                 if needs_escalation(hits, threshold, cascade["margin"])]
+    METRICS.inc('cascade_queries', len(hits_per_query))
+    METRICS.inc('cascade_escalations', len(escalated))
+    if not escalated:
+        return hits_per_query
     
+    with METRICS.stage('cascade_encode'):
+        vecs = encode_queries([augmented[row] for row in escalated], cascade["model"], cascade["query_cache"])
+    with METRICS.stage('cascade_score'):
+        for vec, row in zip(vecs, escalated):
+            rescored = []
+            for c, corpus in enumerate(corpora):
+                ids = np.array([idx for _, hit_c, idx, _ in hits_per_query[row] if hit_c == c], dtype=np.int64)
+                if len(ids):
+                    # Reordered by the accurate model, so the first-pass fused scores no longer apply
+                    scores = corpus["cascade_index"].score(vec[None, :], ids)[0]
+                    rescored.extend((float(score), c, int(idx), None) for idx, score in zip(ids, scores))
+            rescored.sort(key=lambda hit: -hit[0])
+            hits_per_query[row] = rescored
+    return hits_per_query
+
+# Search one or several corpora with a single query encode. With more than one corpus the hits
+# are merged by score (the fused score under hybrid retrieval) and each match records which corpus
+# it came from. cascade (see load_resources) makes `model` the fast first pass and lets the larger
+# model rerank unsure queries.
+# Scenarios naming sections that exist ("section 302") skip the model when the corpora have lookup
+# tables; `neighbours` then adds that many nearest sections per referenced one.
+def search_corpora(scenarios, corpora, model, top_k=3, low_score_threshold=0.3, query_cache=None,
+                   cascade=None, neighbours=0):
+    results, batch = validate_scenarios(scenarios)
+    METRICS.inc('invalid_scenarios', len(scenarios) - len(batch))
+    if all("section_lookup" in corpus for corpus in corpora):
+        with METRICS.stage('section_references'):
+            for i in batch:
+                references = find_section_references(scenarios[i])
+                if references:
+                    results[i] = reference_result(references, corpora, neighbours)
+        remaining = [i for i in batch if results[i] is None]
+        METRICS.inc('section_references', len(batch) - len(remaining))
+        batch = remaining
+    if not batch:
+        return results
+    
+    METRICS.inc('queries', len(batch))
+    with METRICS.stage('augment'):
+        augmented = [augment_input(scenarios[i]) for i in batch]
+    with METRICS.stage('encode'):
+        scenario_vecs = encode_queries(augmented, model, query_cache)
+    pool = max(top_k, cascade["candidates"]) if cascade else top_k
+    with METRICS.stage('score'):
+        ranked = [rank_queries(augmented, scenario_vecs, corpus["embeddings"], pool, **corpus["options"])
+                  for corpus in corpora]
+    
+    if len(corpora) == 1 and not cascade:
+        for row, i in enumerate(batch):
+            top_indices, scores, *fused = ranked[0][row]
+            results[i] = build_result(top_indices, scores, corpora[0]["valid_sections"], low_score_threshold,
+                                      fused[0] if fused else None)
+        return results
+    
+    hits_per_query = []
+    for row in range(len(batch)):
+        hits = []
+        for c, corpus_ranked in enumerate(ranked):
+            ids, scores, *fused = corpus_ranked[row]
+            fused = fused[0] if fused else [None] * len(ids)
+            hits.extend((float(score), c, int(idx), None if f is None else float(f))
+                        for idx, score, f in zip(ids, scores, fused))
+        if len(corpora) > 1:  # Merged by the score each ranker orders by (fused, for hybrid retrieval)
+            hits.sort(key=lambda hit: -(hit[0] if hit[3] is None else hit[3]))
+        hits_per_query.append(hits)
+    if cascade:
+        hits_per_query = cascade_rerank(augmented, hits_per_query, corpora, cascade, low_score_threshold)
+    
+    for hits, i in zip(hits_per_query, batch):
+        hits = hits[:top_k]
+        sections = [corpora[c]["valid_sections"][idx] for _, c, idx, _ in hits]
+        result = build_result(range(len(hits)), [score for score, _, _, _ in hits], sections, low_score_threshold,
+                              [fused for _, _, _, fused in hits])
+        if len(corpora) > 1:
+            for match, (_, c, _, _) in zip(result["matches"], hits):
+                match["corpus"] = corpora[c]["name"]
+        results[i] = result
+    return results
+
+# Process many scenarios with one encode batch and one matrix multiply; results keep input order
+def process_scenarios(scenarios, texts, valid_sections, model, embeddings, top_k=3, low_score_threshold=0.3,
+                      query_cache=None, **search_options):
+    corpus = {"name": None, "texts": texts, "valid_sections": valid_sections, "embeddings": embeddings,
+              "options": search_options}
+    return search_corpora(scenarios, [corpus], model, top_k, low_score_threshold, query_cache)
+
+# Process a single scenario and return top k matches
+def process_scenario(scenario, texts, valid_sections, model, embeddings, top_k=3, low_score_threshold=0.3,
+                     **options):
+    return process_scenarios([scenario], texts, valid_sections, model, embeddings, top_k, low_score_threshold,
+                             **options)[0]
+
+# Models tried in order; later ones are fallbacks if an earlier one fails to load
+MODEL_NAMES = ['all-mpnet-base-v2', 'paraphrase-mpnet-base-v2', 'all-MiniLM-L6-v2']
+
+# Cascade mode answers every query with the fast model and escalates unsure ones to the accurate one
+CASCADE_FAST_MODEL = 'all-MiniLM-L6-v2'
+CASCADE_ACCURATE_MODEL = 'all-mpnet-base-v2'
+
+# Encoder backends: full-precision PyTorch, or the int8-quantized ONNX Runtime export (onnx_encoder.py)
+BACKENDS = ['torch', 'onnx']
+
+# Hub snapshot hash in a cached file path, e.g. .../snapshots/<40 hex digits>/config.json
+SNAPSHOT_RE = re.compile(r'snapshots[\\/]([0-9a-f]{40})')
+
+# Fingerprint of a local model folder from its file names, sizes and modification times; a
+# re-download or re-export rewrites the files and so changes it
+def folder_fingerprint(path):
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for file in sorted(files):
+            full_path = os.path.join(root, file)
+            stat = os.stat(full_path)
+            digest.update(f"{os.path.relpath(full_path, path)}:{stat.st_size}:{stat.st_mtime_ns}\n".encode('utf-8'))
+    return f"local-{digest.hexdigest()[:16]}"
+
+# Revision of a model's weights as they are on disk, found without loading the model: the hub
+# snapshot hash, or a fingerprint of a local (or legacy sentence-transformers cache) folder.
+# None if the model has not been downloaded. Embedding stores are only reused for the same revision.
+def model_revision(name, backend='torch'):
+    if backend == 'onnx':
+        from onnx_encoder import onnx_revision
+        return onnx_revision(name)
+    if os.path.isdir(name):
+        return folder_fingerprint(name)
+    repo_id = name if '/' in name else f"sentence-transformers/{name}"
     try:
-        model = SentenceTransformer('all-mpnet-base-v2')
-    except Exception as e:
-        print(f"Warning: Failed to load primary model, falling back: {e}")
+        from huggingface_hub import try_to_load_from_cache
+        path = try_to_load_from_cache(repo_id, 'config.json')
+    except ImportError:
+        path = None
+    match = SNAPSHOT_RE.search(path) if isinstance(path, str) else None
+    if match:
+        return match.group(1)
+    home = os.environ.get('SENTENCE_TRANSFORMERS_HOME') or os.path.join(
+        os.environ.get('TORCH_HOME') or os.path.join(os.path.expanduser('~'), '.cache', 'torch'), 'sentence_transformers')
+    legacy_dir = os.path.join(home, repo_id.replace('/', '_'))
+    return folder_fingerprint(legacy_dir) if os.path.isdir(legacy_dir) else None
+
+# Load the sentence transformer, falling back to smaller models if needed.
+# sentence_transformers (and with it torch and transformers) is imported here rather than at module
+# level, so paths that never load a model do not pay for it. The returned name identifies the
+# backend too, since embedding stores and query caches must not mix vectors from different backends.
+# Returns (model, name, revision); see model_revision.
+def load_model(backend='torch', threads=None, names=MODEL_NAMES):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown encoder backend '{backend}'.")
+    for i, name in enumerate(names):
         try:
-            model = SentenceTransformer('paraphrase-mpnet-base-v2')
-        except:
-            model = SentenceTransformer('all-MiniLM-L6-v2')
+            if backend == 'onnx':
+                from onnx_encoder import load_onnx_encoder
+                encoder = load_onnx_encoder(name, threads=threads)
+                return encoder, f"{name}-onnx-int8", model_revision(name, backend)
+            from sentence_transformers import SentenceTransformer
+            if threads:
+                import torch
+                torch.set_num_threads(threads)
+            model = SentenceTransformer(name)
+            return model, name, model_revision(name)
+        except Exception as e:
+            if i == len(names) - 1:
+                raise
+            METRICS.inc('model_fallbacks')
+            print(f"Warning: Failed to load model '{name}', falling back: {e}", file=sys.stderr)
+
+# BM25 documents use the full cleaned title and description, not the 512-character embedding text
+def build_lexical_index(valid_sections):
+    documents = []
+    for item in valid_sections:
+        text = f"{clean_text(item.get('section_title', ''))} {clean_text(item.get('section_desc', ''))}"
+        documents.append(text.split())
+    return BM25Index(documents)
+
+# Default approximate-index settings; nlist defaults to sqrt(corpus size)
+IVF_NPROBE = 8
+
+# Segments of a section scored together: 'max' takes the best, 'mean' averages the best SEGMENT_TOP_M
+SEGMENT_POOLING = ['max', 'mean']
+SEGMENT_TOP_M = 2
+
+# Embeddings and vector index of one corpus for one model. multi_vector embeds every overlapping
+# segment of the untruncated section texts (stored as corpus '<name>-segments') instead of one
+# truncated text per section, and scores each section by pooling its segment scores.
+# quantize ('int8' or 'float16') scores a quantized copy first and rescores the best `rescore` exactly.
+def build_section_index(name, model, model_name, texts, hashes, full_texts, section_ids,
+                        cache_dir='embedding_cache', index='flat', nlist=None, nprobe=IVF_NPROBE,
+                        multi_vector=False, pooling='max', top_m=SEGMENT_TOP_M, quantize=None,
+                        rescore=RESCORE_CANDIDATES, revision=None):
+    if not multi_vector:
+        with METRICS.stage('get_embeddings'):
+            embeddings = get_embeddings(texts, model, model_name, cache_dir, revision, section_ids=section_ids,
+                                        corpus=name, hashes=hashes)
+        with METRICS.stage('build_index'):
+            return embeddings, build_vector_index(embeddings, index, nlist, nprobe, quantize, rescore)
+    
+    if index != 'flat' or quantize:
+        raise ValueError("Multi-vector sections can only be searched with the unquantized flat index.")
+    segments, offsets = prepare_segments(full_texts)
+    segment_ids = [f"{section_id}#{j}" for i, section_id in enumerate(section_ids)
+                   for j in range(offsets[i + 1] - offsets[i])]
+    with METRICS.stage('get_embeddings'):
+        embeddings = get_embeddings(segments, model, model_name, cache_dir, revision, section_ids=segment_ids,
+                                    corpus=f"{name}-segments")
+    with METRICS.stage('build_index'):
+        return embeddings, MultiVectorIndex(embeddings, offsets, pooling, top_m)
+
+# Load one statute corpus (same JSON layout as ipc.json) with its embeddings and search indices.
+# cascade_model, a (model, name, revision) triple, adds that model's index for reranking escalated queries.
+def load_corpus(name, filename, model, model_name, cache_dir='embedding_cache', retrieval='dense',
+                candidates=BM25_CANDIDATES, fusion='linear', fusion_weight=FUSION_WEIGHT, index='flat',
+                nlist=None, nprobe=IVF_NPROBE, cascade_model=None, multi_vector=False, pooling='max',
+                top_m=SEGMENT_TOP_M, quantize=None, rescore=RESCORE_CANDIDATES, revision=None):
+    with METRICS.stage('load_corpus'):
+        texts, valid_sections, hashes, full_texts = load_compiled_corpus(name, filename, cache_dir)
+    
+    if not len(texts):
+        return None
+    
+    section_ids = [section.get('Section', 'N/A') for section in valid_sections]
+    segment_options = {"multi_vector": multi_vector, "pooling": pooling, "top_m": top_m}
+    embeddings, vector_index = build_section_index(name, model, model_name, texts, hashes, full_texts, section_ids,
+                                                   cache_dir, index, nlist, nprobe, quantize=quantize,
+                                                   rescore=rescore, revision=revision, **segment_options)
+    cascade_index = None
+    if cascade_model is not None:  # Only rescores given candidates, so exact search is always enough
+        cascade_encoder, cascade_name, cascade_revision = cascade_model
+        _, cascade_index = build_section_index(name, cascade_encoder, cascade_name, texts, hashes, full_texts,
+                                               section_ids, cache_dir, revision=cascade_revision,
+                                               **segment_options)
+    
+    section_lookup, chapter_lookup = build_section_lookup(valid_sections)
+    options = {"vector_index": vector_index}
+    if retrieval == 'hybrid':
+        options.update(lexical_index=build_lexical_index(valid_sections), candidates=candidates,
+                       fusion=fusion, fusion_weight=fusion_weight)
+    elif retrieval != 'dense':
+        raise ValueError(f"Unknown retrieval mode '{retrieval}'.")
+    return {
+        "name": name,
+        "texts": texts,
+        "valid_sections": valid_sections,
+        "embeddings": embeddings,
+        "cascade_index": cascade_index,
+        "section_lookup": section_lookup,
+        "chapter_lookup": chapter_lookup,
+        "options": options
+    }
+
+# Corpus name used for a file when none is given, e.g. 'ipc' for ipc.json
+def corpus_name(filename):
+    return os.path.splitext(os.path.basename(filename))[0]
+
+# Query cache for one model, keyed on its name and weights revision so vectors encoded by older
+# weights are never scored against stores re-encoded for newer ones
+def open_query_cache(model, model_name, revision, capacity, db_path):
+    model_id = f"{model_name}@{revision}" if revision else model_name
+    return QueryCache(model_id, capacity, db_path, model.get_sentence_embedding_dimension())
+
+# Load the model once plus every corpus so they can be reused across queries.
+# corpora maps names to JSON files; by default only `filename` is loaded.
+# retrieval='hybrid' adds a BM25 first stage; index='ivf' swaps exact dense search for an approximate one.
+# cascade=True searches with CASCADE_FAST_MODEL and reranks the first-pass candidates of queries scoring
+# below low_score_threshold (or with a top-2 margin under cascade_margin) with CASCADE_ACCURATE_MODEL.
+def load_resources(filename='ipc.json', cache_dir='embedding_cache', query_cache_size=1024, corpora=None,
+                   backend='torch', threads=None, cascade=False, cascade_margin=CASCADE_MARGIN,
+                   cascade_candidates=CASCADE_CANDIDATES, **corpus_options):
+    if corpora is None:
+        corpora = {corpus_name(filename): filename}
+    query_cache_path = os.path.join(cache_dir, 'query_cache.sqlite')
     
-    embeddings = get_embeddings(texts, model)
+    with trace() as load_trace:
+        with METRICS.stage('load_model'):
+            if cascade:
+                model, model_name, revision = load_model(backend, threads, [CASCADE_FAST_MODEL])
+                accurate_model, accurate_name, accurate_revision = load_model(backend, threads,
+                                                                              [CASCADE_ACCURATE_MODEL])
+            else:
+                model, model_name, revision = load_model(backend, threads)
+        METRICS.note('model', model_name)
+        if cascade:
+            METRICS.note('cascade_model', accurate_name)
+            corpus_options["cascade_model"] = (accurate_model, accurate_name, accurate_revision)
+        loaded = {}
+        for name, path in corpora.items():
+            corpus = load_corpus(name, path, model, model_name, cache_dir, revision=revision, **corpus_options)
+            if corpus is not None:
+                loaded[name] = corpus
+    log_trace('load', load_trace, corpora=list(loaded))
+    if not loaded:
+        return None
     
-    result = process_scenario(scenario, texts, valid_sections, model, embeddings, top_k)
+    cascade_options = None
+    if cascade:
+        cascade_options = {
+            "model": accurate_model,
+            "model_name": accurate_name,
+            "query_cache": open_query_cache(accurate_model, accurate_name, accurate_revision, query_cache_size,
+                                            query_cache_path),
+            "margin": cascade_margin,
+            "candidates": cascade_candidates
+        }
+    return {
+        "model": model,
+        "model_name": model_name,
+        "query_cache": open_query_cache(model, model_name, revision, query_cache_size, query_cache_path),
+        "retrieval": corpus_options.get("retrieval", 'dense'),
+        "index": 'multi' if corpus_options.get("multi_vector") else corpus_options.get("index", 'flat'),
+        "quantize": corpus_options.get("quantize"),
+        "cascade": cascade_options,
+        "corpora": loaded,
+        "load_metrics": load_trace
+    }
+
+_resources = None
+
+# Return the process-wide resources, loading them on first use
+def get_resources():
+    global _resources
+    if _resources is None:
+        _resources = load_resources()
+    return _resources
+
+# How often cascade mode escalated to the accurate model, from the process-wide counters (None when off)
+def cascade_stats(resources, counters=None):
+    if not resources or not resources.get("cascade"):
+        return None
+    if counters is None:
+        counters = METRICS.snapshot()["counters"]
+    queries = counters.get('cascade_queries', 0)
+    escalations = counters.get('cascade_escalations', 0)
+    return {
+        "fast_model": resources["model_name"],
+        "accurate_model": resources["cascade"]["model_name"],
+        "queries": queries,
+        "escalations": escalations,
+        "escalation_rate": round(escalations / queries, 4) if queries else 0.0
+    }
+
+# Shape a process_scenario result into the public find_ipc_section response
+def format_result(scenario, result):
     if "error" in result:
         return result
     
@@ -161,6 +862,65 @@ def find_ipc_section(scenario, top_k=3):
         "warning": result["warning"]
     }
 
+# Answer a scenario from already loaded resources
+def match_scenario(scenario, resources, top_k=3, corpora=None, with_metrics=False, neighbours=0):
+    return match_scenarios([scenario], resources, top_k, corpora, with_metrics, neighbours)[0]
+
+# Answer many scenarios from already loaded resources in one batch; corpora selects which
+# loaded corpora to search by name (all of them by default). with_metrics attaches the stage
+# timings and counters of the call to every result (they describe the whole batch). Scenarios that
+# name sections explicitly return those sections, plus `neighbours` nearest ones each, without the model.
+def match_scenarios(scenarios, resources, top_k=3, corpora=None, with_metrics=False, neighbours=0):
+    if resources is None:
+        return [{"error": "No valid data found in JSON."} for _ in scenarios]
+    
+    names = list(resources["corpora"]) if not corpora else list(corpora)
+    unknown = [name for name in names if name not in resources["corpora"]]
+    if unknown:
+        return [{"error": f"Unknown corpus: {', '.join(unknown)}."} for _ in scenarios]
+    
+    with trace() as current:
+        results = search_corpora(scenarios, [resources["corpora"][name] for name in names], resources["model"],
+                                 top_k, query_cache=resources["query_cache"], cascade=resources.get("cascade"),
+                                 neighbours=neighbours)
+    log_trace('match', current, scenarios=len(scenarios), corpora=names)
+    results = [format_result(scenario, result) for scenario, result in zip(scenarios, results)]
+    if with_metrics:
+        for result in results:
+            result["metrics"] = current
+    return results
+
+# Fetch sections by number (e.g. '302', '498a') or all sections of a chapter by chapter number,
+# from every loaded corpus or the named ones
+def lookup_sections(resources, section=None, chapter=None, corpora=None):
+    if resources is None:
+        return {"error": "No valid data found in JSON."}
+    names = list(resources["corpora"]) if not corpora else list(corpora)
+    unknown = [name for name in names if name not in resources["corpora"]]
+    if unknown:
+        return {"error": f"Unknown corpus: {', '.join(unknown)}."}
+    
+    key = str(section if section is not None else chapter).strip().upper()
+    matches = []
+    for name in names:
+        corpus = resources["corpora"][name]
+        if section is not None:
+            rows = [corpus["section_lookup"][key]] if key in corpus["section_lookup"] else []
+        else:
+            rows = corpus["chapter_lookup"].get(key, [])
+        for idx in rows:
+            match = section_match(corpus["valid_sections"][idx], 1.0)
+            if len(names) > 1:
+                match["corpus"] = name
+            matches.append(match)
+    if not matches:
+        return {"error": f"{'Section' if section is not None else 'Chapter'} {key} not found."}
+    return {"matches": matches}
+
+# Main function to process a scenario
+def find_ipc_section(scenario, top_k=3):
+    return match_scenario(scenario, get_resources(), top_k)
+
 # Formatted print function
 def print_results(result):
     if "error" in result:
@@ -182,12 +942,162 @@ def print_results(result):
         print(f"   Description: {match['description']}")
         print(f"   Confidence Score: {match['score']:.4f} ({score_pct:.2f}%)")
 
-# Interactive input
-if __name__ == "__main__":
+# Command-line options for loading resources, shared by app.py and ipc_service.py
+def add_resource_arguments(parser):
+    parser.add_argument('--data', default='ipc.json', help='Path to the IPC JSON corpus')
+    parser.add_argument('--corpus', metavar='NAME=FILE', action='append',
+                        help='Statute corpus to load and search (repeatable); replaces --data when given')
+    parser.add_argument('--rules', metavar='FILE', help='JSON keyword rules file replacing the built-in keyword_map')
+    parser.add_argument('--retrieval', choices=['dense', 'hybrid'], default='dense',
+                        help='hybrid: BM25 candidate filter followed by dense reranking')
+    parser.add_argument('--candidates', type=int, default=BM25_CANDIDATES, help='BM25 candidates per scenario')
+    parser.add_argument('--fusion', choices=['linear', 'rrf'], default='linear')
+    parser.add_argument('--fusion-weight', type=float, default=FUSION_WEIGHT, help='Weight of the dense score')
+    parser.add_argument('--index', choices=['flat', 'ivf'], default='flat',
+                        help='Dense vector index: exact flat search or approximate IVF')
+    parser.add_argument('--nlist', type=int, help='IVF cells (default: sqrt of the corpus size)')
+    parser.add_argument('--nprobe', type=int, default=IVF_NPROBE, help='IVF cells searched per query')
+    parser.add_argument('--multi-vector', action='store_true',
+                        help='Embed overlapping segments of whole sections instead of their first 512 characters')
+    parser.add_argument('--pooling', choices=SEGMENT_POOLING, default='max',
+                        help='Section score from its segment scores: best segment, or mean of the best --top-m')
+    parser.add_argument('--top-m', type=int, default=SEGMENT_TOP_M, help='Segments averaged by --pooling mean')
+    parser.add_argument('--quantize', choices=QUANTIZED_TYPES,
+                        help='Score a quantized copy of the embeddings first, then rescore the best candidates exactly')
+    parser.add_argument('--rescore', type=int, default=RESCORE_CANDIDATES,
+                        help='Candidates per scenario rescored with float32 embeddings when --quantize is set')
+    parser.add_argument('--backend', choices=BACKENDS, default='torch',
+                        help='Encoder backend: PyTorch, or int8-quantized ONNX Runtime (exported on first use)')
+    parser.add_argument('--threads', type=int, help='CPU threads for the encoder')
+    parser.add_argument('--cascade', action='store_true',
+                        help=f'Answer with {CASCADE_FAST_MODEL}; rerank unsure queries with {CASCADE_ACCURATE_MODEL}')
+    parser.add_argument('--cascade-margin', type=float, default=CASCADE_MARGIN,
+                        help='Escalate when the top two scores are closer than this')
+    parser.add_argument('--cascade-candidates', type=int, default=CASCADE_CANDIDATES,
+                        help='First-pass candidates reranked for an escalated query')
+    parser.add_argument('--metrics-log', metavar='FILE', help="Write per-call stage timings as JSON lines ('-' for stderr)")
+
+# Turn NAME=FILE (or bare FILE) --corpus values into {name: file}
+def parse_corpus_specs(specs):
+    corpora = {}
+    for spec in specs:
+        name, sep, path = spec.partition('=')
+        if not sep:
+            name, path = corpus_name(spec), spec
+        corpora[name] = path
+    return corpora
+
+# Turn parsed resource arguments into load_resources keyword arguments (installs --rules as a side effect)
+def resource_options(args):
+    if args.rules:
+        load_query_rules(args.rules)
+    if args.metrics_log:
+        configure_metrics_log(args.metrics_log)
+    return {
+        "filename": args.data,
+        "corpora": parse_corpus_specs(args.corpus) if args.corpus else None,
+        "retrieval": args.retrieval,
+        "candidates": args.candidates,
+        "fusion": args.fusion,
+        "fusion_weight": args.fusion_weight,
+        "index": args.index,
+        "nlist": args.nlist,
+        "nprobe": args.nprobe,
+        "multi_vector": args.multi_vector,
+        "pooling": args.pooling,
+        "top_m": args.top_m,
+        "quantize": args.quantize,
+        "rescore": args.rescore,
+        "backend": args.backend,
+        "threads": args.threads,
+        "cascade": args.cascade,
+        "cascade_margin": args.cascade_margin,
+        "cascade_candidates": args.cascade_candidates
+    }
+
+# Read scenarios lazily from JSONL: objects with "scenario" (and optional "id") or bare JSON strings
+def iter_jsonl_scenarios(stream):
+    for line_no, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            yield {"id": line_no, "error": "Invalid JSON line."}
+            continue
+        if isinstance(record, str):
+            record = {"scenario": record}
+        if not isinstance(record, dict) or not isinstance(record.get("scenario"), str):
+            yield {"id": line_no, "error": "Expected a JSON string or an object with a 'scenario' string."}
+            continue
+        record.setdefault("id", line_no)
+        yield record
+
+# Stream JSONL scenarios through one warm model in fixed-size batches; memory is bounded by batch_size
+def run_batch(in_stream, out_stream, resources, batch_size=64, top_k=3, with_metrics=False):
+    records = iter_jsonl_scenarios(in_stream)
+    processed = 0
+    while True:
+        chunk = list(itertools.islice(records, batch_size))
+        if not chunk:
+            break
+        valid = [record for record in chunk if "error" not in record]
+        results = iter(match_scenarios([record["scenario"] for record in valid], resources, top_k,
+                                       with_metrics=with_metrics))
+        for record in chunk:
+            result = record if "error" in record else dict(next(results), id=record["id"])
+            out_stream.write(json.dumps(result, ensure_ascii=False) + "\n")
+        out_stream.flush()
+        processed += len(chunk)
+    return processed
+
+# Prompt for scenarios until an empty line is entered
+def run_interactive(resources):
     print("Enter a scenario to find matching IPC sections (or press Enter to exit):")
     user_scenario = input().strip()
     while user_scenario:
-        result = find_ipc_section(user_scenario)
+        result = match_scenario(user_scenario, resources)
         print_results(result)
         print("\nEnter another scenario (or press Enter to exit):")
-        user_scenario = input().strip()
\ No newline at end of file
+        user_scenario = input().strip()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Find IPC sections matching a scenario')
+    parser.add_argument('--batch', metavar='FILE', nargs='?', const='-',
+                        help='Read JSONL scenarios from FILE (or stdin with "-") and write JSONL results')
+    parser.add_argument('--output', metavar='FILE', default='-', help='Where to write JSONL results (default: stdout)')
+    parser.add_argument('--batch-size', type=int, default=64, help='Scenarios encoded per model call')
+    parser.add_argument('--top-k', type=int, default=3)
+    parser.add_argument('--metrics', action='store_true', help='Include per-batch stage timings in JSONL results')
+    parser.add_argument('--prometheus', metavar='FILE', help='Write a Prometheus text dump of all metrics on exit')
+    parser.add_argument('--compile', action='store_true',
+                        help='Compile the corpora and their embedding stores into embedding_cache/, then exit')
+    add_resource_arguments(parser)
+    args = parser.parse_args()
+    
+    if args.compile:
+        resources = load_resources(**resource_options(args))
+        if resources is None:
+            sys.exit("No valid data found in JSON.")
+        for name, corpus in resources["corpora"].items():
+            print(f"Compiled '{name}': {len(corpus['texts'])} sections -> {corpus_artifact_path(name)}")
+    elif args.batch is None:
+        run_interactive(load_resources(**resource_options(args)))
+    else:
+        # Keep model-loading chatter off stdout so it cannot corrupt the JSONL stream
+        with contextlib.redirect_stdout(sys.stderr):
+            resources = load_resources(**resource_options(args))
+        in_stream = sys.stdin if args.batch == '-' else open(args.batch, 'r', encoding='utf-8')
+        out_stream = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+        try:
+            count = run_batch(in_stream, out_stream, resources, max(1, args.batch_size), args.top_k, args.metrics)
+        finally:
+            if in_stream is not sys.stdin:
+                in_stream.close()
+            if out_stream is not sys.stdout:
+                out_stream.close()
+        print(f"Processed {count} scenarios.", file=sys.stderr)
+    if args.prometheus:
+        with open(args.prometheus, 'w', encoding='utf-8') as f:
+            f.write(METRICS.prometheus_text())
\ No newline at end of file
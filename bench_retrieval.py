@@ -0,0 +1,201 @@
+import argparse
+import contextlib
+import json
+import sys
+import time
+
+import numpy as np
+
+import app
+from vector_index import FlatIndex, QuantizedIndex
+
+# Metrics compared against a baseline: (name, higher_is_better)
+COMPARED_METRICS = [
+    ("recall@1", True), ("recall@3", True),
+    ("latency_ms.p50", False), ("latency_ms.p95", False), ("latency_ms.p99", False),
+    ("throughput_qps", True), ("batch_throughput_qps", True), ("peak_rss_mb", False)
+]
+
+# Labeled scenarios: one JSON object per line with "scenario" and "expected" section numbers
+def load_labeled_scenarios(path):
+    scenarios = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                record = json.loads(line)
+                record["expected"] = [str(section).upper() for section in record["expected"]]
+                scenarios.append(record)
+    return scenarios
+
+# Peak resident set size of this process in MB, or None where it cannot be read
+def peak_rss_mb():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss) / 1024 / 1024
+    except ImportError:
+        return None
+
+# 1.0 if any acceptable section appears in the top k; "expected" lists alternatives (e.g. 378 or 379)
+def recall_at(matches, expected, k):
+    found = {str(match['section']).upper() for match in matches[:k]}
+    return 1.0 if found & set(expected) else 0.0
+
+# Replay labeled scenarios one at a time (latency) and as one batch (throughput)
+def run_benchmark(resources, scenarios, top_k=3, repeat=1):
+    texts = [record["scenario"] for record in scenarios]
+    app.match_scenarios(texts[:1], resources, top_k)  # Warm-up: lazy initialisation is not query latency
+
+    counters_before = app.METRICS.snapshot()["counters"]
+    latencies = []
+    recalls = {1: [], 3: []}
+    misses = []
+    for _ in range(repeat):
+        for record in scenarios:
+            t0 = time.perf_counter()
+            result = app.match_scenario(record["scenario"], resources, max(top_k, 3))
+            latencies.append(time.perf_counter() - t0)
+            matches = result.get("top_matches", [])
+            for k in recalls:
+                recalls[k].append(recall_at(matches, record["expected"], k))
+            if recall_at(matches, record["expected"], 3) == 0:
+                misses.append({"scenario": record["scenario"], "expected": record["expected"],
+                               "got": [str(match['section']) for match in matches[:3]]})
+
+    counters = app.METRICS.snapshot()["counters"]
+    cascade = app.cascade_stats(resources, {name: counters.get(name, 0) - counters_before.get(name, 0)
+                                            for name in ('cascade_queries', 'cascade_escalations')})
+
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        app.match_scenarios(texts, resources, top_k)
+    batch_seconds = time.perf_counter() - t0
+
+    latencies_ms = np.array(latencies) * 1000
+    rss = peak_rss_mb()
+    return {
+        "scenarios": len(scenarios),
+        "repeat": repeat,
+        "model": resources["model_name"],
+        "retrieval": resources["retrieval"],
+        "index": resources["index"],
+        "cascade": cascade,
+        "recall@1": round(float(np.mean(recalls[1])), 4),
+        "recall@3": round(float(np.mean(recalls[3])), 4),
+        "latency_ms": {
+            "mean": round(float(latencies_ms.mean()), 3),
+            "p50": round(float(np.percentile(latencies_ms, 50)), 3),
+            "p95": round(float(np.percentile(latencies_ms, 95)), 3),
+            "p99": round(float(np.percentile(latencies_ms, 99)), 3)
+        },
+        "throughput_qps": round(len(latencies) / float(np.sum(latencies)), 2),
+        "batch_throughput_qps": round(len(texts) * repeat / batch_seconds, 2),
+        "peak_rss_mb": None if rss is None else round(rss, 1),
+        "quantization": quantization_report(resources, scenarios, max(top_k, 3)),
+        "misses@3": misses[:len(scenarios)]
+    }
+
+# For every corpus searched through a quantized index: memory of the quantized copy against float32,
+# and the share of exact-search top-k hits it still returns with and without exact rescoring
+def quantization_report(resources, scenarios, top_k=3):
+    indices = {name: corpus["options"]["vector_index"] for name, corpus in resources["corpora"].items()
+               if isinstance(corpus["options"]["vector_index"], QuantizedIndex)}
+    if not indices:
+        return None
+    augmented = [app.augment_input(record["scenario"]) for record in scenarios]
+    queries = app.encode_queries(augmented, resources["model"])
+    report = {}
+    for name, index in indices.items():
+        k = min(top_k, len(index))
+        exact = [set(ids) for ids, _ in FlatIndex(index.vectors).search(queries, k)]
+        def agreement(rescore):
+            found = index.search(queries, k, rescore)
+            return round(float(np.mean([len(set(ids) & want) / k for (ids, _), want in zip(found, exact)])), 4)
+        float32_mb = index.vectors.shape[0] * index.vectors.shape[1] * 4 / 1024 / 1024
+        quantized_mb = index.nbytes / 1024 / 1024
+        report[name] = {
+            "dtype": index.kind,
+            "rescore": index.rescore,
+            "float32_mb": round(float32_mb, 3),
+            "quantized_mb": round(quantized_mb, 3),
+            "saved_mb": round(float32_mb - quantized_mb, 3),
+            f"recall@{k}_vs_exact": agreement(None),
+            f"recall@{k}_vs_exact_without_rescore": agreement(0)
+        }
+    return report
+
+def _metric(report, name):
+    value = report
+    for key in name.split('.'):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+# Relative change per metric against a stored baseline; regressions beyond the tolerances are flagged
+def compare_to_baseline(report, baseline, recall_tolerance=0.0, latency_tolerance=0.2):
+    diff = {}
+    regressions = []
+    for name, higher_is_better in COMPARED_METRICS:
+        new, old = _metric(report, name), _metric(baseline, name)
+        if new is None or old is None:
+            continue
+        change = (new - old) / old if old else 0.0
+        diff[name] = {"baseline": old, "current": new, "change": round(change, 4),
+                      "improved": (new > old) if higher_is_better else (new < old)}
+        if name.startswith("recall"):
+            if old - new > recall_tolerance:
+                regressions.append(f"{name} dropped from {old} to {new}")
+        elif name.startswith("latency") and change > latency_tolerance:
+            regressions.append(f"{name} rose {change:.0%} ({old} -> {new})")
+    return diff, regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay labeled scenarios and report retrieval latency and recall')
+    parser.add_argument('--scenarios', default='bench_scenarios.jsonl', help='Labeled JSONL scenarios')
+    parser.add_argument('--repeat', type=int, default=3, help='Times to replay the scenario set')
+    parser.add_argument('--top-k', type=int, default=3)
+    parser.add_argument('--use-query-cache', action='store_true',
+                        help='Keep the query embedding cache (by default every query is encoded)')
+    parser.add_argument('--output', help='Write the JSON report here (e.g. to store as a baseline)')
+    parser.add_argument('--baseline', help='Compare against a previously written report')
+    parser.add_argument('--recall-tolerance', type=float, default=0.0, help='Allowed absolute recall drop')
+    parser.add_argument('--latency-tolerance', type=float, default=0.2, help='Allowed relative latency increase')
+    app.add_resource_arguments(parser)
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(sys.stderr):
+        resources = app.load_resources(**app.resource_options(args))
+    if resources is None:
+        sys.exit("No valid data found in JSON.")
+    if not args.use_query_cache:
+        resources["query_cache"] = None
+        if resources["cascade"]:
+            resources["cascade"]["query_cache"] = None
+
+    report = run_benchmark(resources, load_labeled_scenarios(args.scenarios), args.top_k, max(1, args.repeat))
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        report["baseline_diff"], regressions = compare_to_baseline(report, baseline, args.recall_tolerance,
+                                                                   args.latency_tolerance)
+        report["regressions"] = regressions
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+    print(text)
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
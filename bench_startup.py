@@ -0,0 +1,100 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Modules that must not be imported just by importing app.py
+HEAVY_MODULES = ['sentence_transformers', 'torch', 'transformers', 'sklearn']
+
+_IMPORT_PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import app
+elapsed = time.perf_counter() - t0
+print(json.dumps({"seconds": elapsed, "heavy": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+# Time `import app` in fresh interpreters so nothing is already cached in sys.modules
+def measure_import(repeat=3):
+    here = os.path.dirname(os.path.abspath(__file__))
+    runs = []
+    heavy = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', _IMPORT_PROBE], cwd=here, capture_output=True,
+                             text=True, check=True)
+        probe = json.loads(out.stdout.strip().splitlines()[-1])
+        runs.append(probe["seconds"])
+        heavy = probe["heavy"]
+    return {"seconds": statistics.median(runs), "runs": runs, "heavy_modules": heavy}
+
+def timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - t0
+
+# Cold-start report: import, corpus load, model load, embedding store load, index build, first query
+def measure_startup(filename='ipc.json', repeat=3, scenario="A man snatched a phone from a woman on the street"):
+    report = {"import": measure_import(repeat)}
+
+    import app
+    name = app.corpus_name(filename)
+    compiled = app.load_corpus_artifact(app.corpus_artifact_path(name), app.corpus_fingerprint(filename)) is not None
+    (texts, valid_sections, hashes, _), corpus_seconds = timed(app.load_compiled_corpus, name, filename)
+    report["corpus"] = {"seconds": corpus_seconds, "from_artifact": compiled, "sections": len(texts)}
+
+    (model, model_name, revision), model_seconds = timed(app.load_model)
+    report["model"] = {"seconds": model_seconds, "name": model_name}
+
+    section_ids = [section.get('Section', 'N/A') for section in valid_sections]
+    embeddings, embed_seconds = timed(app.get_embeddings, texts, model, model_name, revision=revision,
+                                      section_ids=section_ids, corpus=name, hashes=hashes)
+    report["embeddings"] = {"seconds": embed_seconds, "shape": list(embeddings.shape)}
+
+    index, index_seconds = timed(app.build_vector_index, embeddings)
+    report["index"] = {"seconds": index_seconds, "kind": index.kind}
+
+    corpus = {"name": name, "texts": texts, "valid_sections": valid_sections,
+              "embeddings": embeddings, "options": {"vector_index": index}}
+    _, query_seconds = timed(app.search_corpora, [scenario], [corpus], model)
+    report["first_query"] = {"seconds": query_seconds}
+
+    report["total_seconds"] = sum(report[stage]["seconds"]
+                                  for stage in ("import", "corpus", "model", "embeddings", "index", "first_query"))
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure app.py cold-start time per stage')
+    parser.add_argument('--data', default='ipc.json', help='Path to the IPC JSON corpus')
+    parser.add_argument('--repeat', type=int, default=3, help='Fresh-interpreter import runs (median is reported)')
+    parser.add_argument('--max-import', type=float, help='Fail if importing app.py takes longer (seconds)')
+    parser.add_argument('--max-corpus', type=float, help='Fail if loading and preparing the corpus takes longer')
+    parser.add_argument('--max-model', type=float, help='Fail if loading the model takes longer')
+    parser.add_argument('--max-total', type=float, help='Fail if the whole cold start takes longer')
+    parser.add_argument('--output', help='Also write the JSON report to this file')
+    args = parser.parse_args()
+
+    report = measure_startup(args.data, max(1, args.repeat))
+
+    failures = []
+    if report["import"]["heavy_modules"]:
+        failures.append(f"importing app.py loaded {', '.join(report['import']['heavy_modules'])}")
+    budgets = [("import", args.max_import), ("corpus", args.max_corpus), ("model", args.max_model)]
+    for stage, budget in budgets:
+        if budget is not None and report[stage]["seconds"] > budget:
+            failures.append(f"{stage} took {report[stage]['seconds']:.3f}s (budget {budget}s)")
+    if args.max_total is not None and report["total_seconds"] > args.max_total:
+        failures.append(f"total took {report['total_seconds']:.3f}s (budget {args.max_total}s)")
+    report["failures"] = failures
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import app
+
+# Texts per shard: the unit of work handed to a worker and written to disk when it finishes
+SHARD_SIZE = 64
+
+_worker_model = None
+
+def _init_worker(model_name, backend, threads):
+    global _worker_model
+    _worker_model, _, _ = app.load_model(backend, threads, [model_name])
+
+def _worker_dimension():
+    return _worker_model.get_sentence_embedding_dimension()
+
+def _encode_shard(texts):
+    return np.asarray(_worker_model.encode(texts, convert_to_numpy=True), dtype=np.float32)
+
+# Stands in for the model in app.get_embeddings, spreading encode() over a pool of worker processes.
+# Texts are sorted by length so each shard pads little, and every finished shard is saved under
+# shard_dir keyed by its content, so an interrupted build resumes with only the unfinished shards.
+# The pool (one model load per worker) only starts once something needs encoding, so rebuilding
+# stores that are already current loads no model at all.
+class ParallelEncoder:
+    def __init__(self, model_name, shard_dir, workers=None, backend='torch', shard_size=SHARD_SIZE):
+        self.model_name = model_name
+        self.shard_dir = shard_dir
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.backend = backend
+        self.shard_size = max(1, shard_size)
+        self.encoded = 0
+        self.resumed = 0
+        self.seconds = 0.0
+        self._pool = None
+        self._dimension = None
+
+    def _executor(self):
+        if self._pool is None:
+            threads = max(1, (os.cpu_count() or 1) // self.workers)
+            # spawn: forking a process that already initialised torch threads can deadlock
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                             initializer=_init_worker,
+                                             initargs=(self.model_name, self.backend, threads))
+        return self._pool
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    # Start the workers (loading, and if needed downloading, the model) and learn the dimension
+    def start(self):
+        if self._dimension is None:
+            self._dimension = self._executor().submit(_worker_dimension).result()
+        return self._dimension
+
+    # None until the workers are started: get_embeddings then skips its dimension check, which the
+    # store's model revision already covers, instead of starting the pool just to answer
+    def get_sentence_embedding_dimension(self):
+        return self._dimension
+
+    def _shard_path(self, texts):
+        digest = hashlib.sha256()
+        for text in texts:
+            digest.update(app.text_hash(text).encode('ascii'))
+        return os.path.join(self.shard_dir, f"{digest.hexdigest()[:32]}.npy")
+
+    def encode(self, sentences, show_progress_bar=False, convert_to_numpy=True, **kwargs):
+        texts = list(sentences)
+        t0 = time.perf_counter()
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        shards = [order[start:start + self.shard_size] for start in range(0, len(order), self.shard_size)]
+        out = np.zeros((len(texts), self.start()), dtype=np.float32)
+        os.makedirs(self.shard_dir, exist_ok=True)
+
+        pending = {}
+        for rows in shards:
+            path = self._shard_path([texts[i] for i in rows])
+            if os.path.exists(path):
+                out[rows] = np.load(path)
+                self.resumed += len(rows)
+            else:
+                pending[self._executor().submit(_encode_shard, [texts[i] for i in rows])] = (rows, path)
+
+        done = 0
+        for future in as_completed(pending):
+            rows, path = pending[future]
+            vectors = future.result()
+            with open(f"{path}.tmp", 'wb') as f:
+                np.save(f, vectors)
+            os.replace(f"{path}.tmp", path)
+            out[rows] = vectors
+            done += len(rows)
+            if show_progress_bar:
+                print(f"\r{done}/{sum(len(rows) for rows, _ in pending.values())} sections encoded", end='',
+                      file=sys.stderr, flush=True)
+        if show_progress_bar and pending:
+            print(file=sys.stderr)
+        self.encoded += done
+        self.seconds += time.perf_counter() - t0
+        return out
+
+    # Drop the shards once their vectors are safely in the embedding store
+    def remove_shards(self):
+        if os.path.isdir(self.shard_dir):
+            for name in os.listdir(self.shard_dir):
+                if name.endswith('.npy'):
+                    os.remove(os.path.join(self.shard_dir, name))
+
+    def report(self):
+        return {
+            "model": self.model_name,
+            "workers": self.workers,
+            "encoded": self.encoded,
+            "resumed": self.resumed,
+            "seconds": round(self.seconds, 3),
+            "sections_per_second": round(self.encoded / self.seconds, 2) if self.seconds and self.encoded else None
+        }
+
+# Build the embedding stores of every corpus for one model, the same ones load_resources would use
+def build_embeddings(model_name, corpora, cache_dir='embedding_cache', workers=None, backend='torch',
+                     shard_size=SHARD_SIZE, multi_vector=False, keep_shards=False):
+    store_name = f"{model_name}-onnx-int8" if backend == 'onnx' else model_name
+    shard_dir = os.path.join(cache_dir, 'shards', re.sub(r'[^\w.-]', '_', store_name))
+    encoder = ParallelEncoder(model_name, shard_dir, workers, backend, shard_size)
+    reports = []
+    try:
+        revision = app.model_revision(model_name, backend)
+        if revision is None:  # Not downloaded yet: the workers fetch it while loading
+            encoder.start()
+            revision = app.model_revision(model_name, backend)
+        for name, path in corpora.items():
+            texts, valid_sections, hashes, full_texts = app.load_compiled_corpus(name, path, cache_dir)
+            section_ids = [section.get('Section', 'N/A') for section in valid_sections]
+            before = encoder.encoded
+            t0 = time.perf_counter()
+            embeddings, _ = app.build_section_index(name, encoder, store_name, texts, hashes, full_texts, section_ids,
+                                                    cache_dir, multi_vector=multi_vector, revision=revision)
+            reports.append({"corpus": name, "model": store_name, "vectors": int(embeddings.shape[0]),
+                            "encoded": encoder.encoded - before, "seconds": round(time.perf_counter() - t0, 3)})
+    finally:
+        encoder.close()
+    if not keep_shards:
+        encoder.remove_shards()
+    return {"corpora": reports, "encoder": encoder.report()}
+
+def main():
+    parser = argparse.ArgumentParser(description='Build embedding stores with a pool of encoder processes')
+    parser.add_argument('--model', action='append',
+                        help=f'Model to build stores for (repeatable; default: {app.MODEL_NAMES[0]})')
+    parser.add_argument('--data', default='ipc.json', help='Path to the IPC JSON corpus')
+    parser.add_argument('--corpus', metavar='NAME=FILE', action='append',
+                        help='Statute corpus to build (repeatable); replaces --data when given')
+    parser.add_argument('--cache-dir', default='embedding_cache')
+    parser.add_argument('--workers', type=int, help='Encoder processes (default: one per CPU)')
+    parser.add_argument('--backend', choices=app.BACKENDS, default='torch')
+    parser.add_argument('--shard-size', type=int, default=SHARD_SIZE, help='Texts per resumable shard')
+    parser.add_argument('--multi-vector', action='store_true', help='Build the segment stores used by --multi-vector')
+    parser.add_argument('--keep-shards', action='store_true', help='Keep shard files after the stores are written')
+    args = parser.parse_args()
+
+    corpora = app.parse_corpus_specs(args.corpus) if args.corpus else {app.corpus_name(args.data): args.data}
+    reports = [build_embeddings(model, corpora, args.cache_dir, args.workers, args.backend, args.shard_size,
+                                args.multi_vector, args.keep_shards)
+               for model in args.model or app.MODEL_NAMES[:1]]
+    print(json.dumps(reports, indent=2))
+
+if __name__ == "__main__":
+    main()
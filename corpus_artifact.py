@@ -0,0 +1,125 @@
+import json
+import os
+import sys
+
+import numpy as np
+
+# Bump when the artifact layout changes so old files are rebuilt rather than misread
+CORPUS_ARTIFACT_VERSION = 2
+
+# Section fields kept from each JSON item, in the order app.py reads them
+SECTION_FIELDS = ['chapter', 'chapter_title', 'Section', 'section_title', 'section_desc']
+
+# How a field value is restored from its string form
+_KIND_STR, _KIND_INT, _KIND_MISSING = 0, 1, 2
+
+# Many strings packed into one UTF-8 buffer plus offsets; an item is decoded only when accessed
+class StringColumn:
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def pack(cls, strings):
+        encoded = [s.encode('utf-8') for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(b) for b in encoded])
+        return cls(np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tobytes().decode('utf-8')
+
+    def __iter__(self):
+        buffer = self.data.tobytes()
+        for start, end in zip(self.offsets[:-1], self.offsets[1:]):
+            yield buffer[start:end].decode('utf-8')
+
+# Section records stored column-wise. Indexing yields the same dicts as the original JSON items
+# (restricted to SECTION_FIELDS), so it can stand in for the valid_sections list.
+class SectionTable:
+    def __init__(self, columns, kinds):
+        self.columns = columns  # field -> StringColumn
+        self.kinds = kinds      # field -> int8 array of _KIND_* per row
+
+    @classmethod
+    def from_sections(cls, sections):
+        columns, kinds = {}, {}
+        for field in SECTION_FIELDS:
+            values = [section.get(field) for section in sections]
+            kinds[field] = np.array([_KIND_MISSING if field not in section else
+                                     _KIND_INT if isinstance(value, int) else _KIND_STR
+                                     for section, value in zip(sections, values)], dtype=np.int8)
+            columns[field] = StringColumn.pack(['' if value is None else str(value) for value in values])
+        return cls(columns, kinds)
+
+    def __len__(self):
+        return len(self.columns[SECTION_FIELDS[0]])
+
+    def __getitem__(self, i):
+        record = {}
+        for field in SECTION_FIELDS:
+            kind = self.kinds[field][i]
+            if kind == _KIND_MISSING:
+                continue
+            value = self.columns[field][i]
+            record[field] = int(value) if kind == _KIND_INT else value
+        return record
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+# Write the compiled corpus atomically as one .npz of plain arrays (no pickled objects).
+# texts are the (truncated) embedding texts; full_texts the untruncated cleaned texts.
+def save_corpus_artifact(path, texts, sections, hashes, fingerprint, full_texts):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    table = sections if isinstance(sections, SectionTable) else SectionTable.from_sections(sections)
+    text_column = texts if isinstance(texts, StringColumn) else StringColumn.pack(texts)
+    full_column = full_texts if isinstance(full_texts, StringColumn) else StringColumn.pack(full_texts)
+    meta = dict(fingerprint, version=CORPUS_ARTIFACT_VERSION, count=len(text_column))
+    arrays = {
+        "meta": np.frombuffer(json.dumps(meta).encode('utf-8'), dtype=np.uint8),
+        "texts.data": text_column.data,
+        "texts.offsets": text_column.offsets,
+        "full_texts.data": full_column.data,
+        "full_texts.offsets": full_column.offsets,
+        "hashes": np.array([bytes.fromhex(h) for h in hashes], dtype='S32').view(np.uint8).reshape(-1, 32)
+    }
+    for field in SECTION_FIELDS:
+        arrays[f"{field}.data"] = table.columns[field].data
+        arrays[f"{field}.offsets"] = table.columns[field].offsets
+        arrays[f"{field}.kinds"] = table.kinds[field]
+    with open(f"{path}.tmp", 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(f"{path}.tmp", path)
+
+# Returns (texts, sections, hashes, full_texts), or None when the artifact is missing, unreadable or was
+# compiled from a different source file or with different cleaning rules
+def load_corpus_artifact(path, fingerprint):
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as archive:
+            meta = json.loads(archive["meta"].tobytes().decode('utf-8'))
+            if meta.get("version") != CORPUS_ARTIFACT_VERSION:
+                return None
+            if any(meta.get(key) != value for key, value in fingerprint.items()):
+                return None
+            texts = StringColumn(archive["texts.data"], archive["texts.offsets"])
+            full_texts = StringColumn(archive["full_texts.data"], archive["full_texts.offsets"])
+            columns = {field: StringColumn(archive[f"{field}.data"], archive[f"{field}.offsets"])
+                       for field in SECTION_FIELDS}
+            kinds = {field: archive[f"{field}.kinds"] for field in SECTION_FIELDS}
+            hashes = [row.tobytes().hex() for row in archive["hashes"]]
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Warning: Ignoring unreadable corpus artifact '{path}': {e}", file=sys.stderr)
+        return None
+    if len(texts) != meta.get("count") or len(hashes) != len(texts) or len(full_texts) != len(texts):
+        return None
+    return texts, SectionTable(columns, kinds), hashes, full_texts
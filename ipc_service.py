@@ -0,0 +1,298 @@
+import argparse
+import asyncio
+import json
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+import app
+from micro_batcher import MAX_BATCH_SIZE, MAX_WAIT_MS, MicroBatcher
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# Holds the warm corpus/model/embeddings and reports readiness while loading.
+# micro_batch=True routes concurrent find requests through a MicroBatcher on its own event loop.
+class IPCService:
+    def __init__(self, filename='ipc.json', micro_batch=False, max_batch_size=MAX_BATCH_SIZE,
+                 max_wait_ms=MAX_WAIT_MS, **resource_options):
+        self.filename = filename
+        self.resource_options = resource_options
+        self.micro_batch = micro_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.batcher = None
+        self._batch_loop = None
+        self.status = "loading"
+        self.error = None
+        self.resources = None
+        self.started_at = time.time()
+        self.load_seconds = None
+        self.requests_served = 0
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+
+    # Load everything in a background thread so health checks answer immediately
+    def start(self):
+        thread = threading.Thread(target=self._load, daemon=True)
+        thread.start()
+        return thread
+
+    def _load(self):
+        t0 = time.perf_counter()
+        try:
+            self.resources = app.load_resources(self.filename, **self.resource_options)
+            if self.resources is None:
+                raise ValueError("No valid data found in JSON.")
+            if self.micro_batch:
+                self._start_batcher()
+            self.status = "ready"
+        except BaseException as e:  # load_ipc_data exits via SystemExit
+            self.status = "error"
+            self.error = str(e) or type(e).__name__
+        self.load_seconds = time.perf_counter() - t0
+        self._ready.set()
+
+    def _start_batcher(self):
+        self.batcher = MicroBatcher(self.resources, self.max_batch_size, self.max_wait_ms)
+        self._batch_loop = asyncio.new_event_loop()
+        threading.Thread(target=self._batch_loop.run_forever, daemon=True).start()
+        asyncio.run_coroutine_threadsafe(self.batcher.start(), self._batch_loop).result()
+
+    def wait_until_ready(self, timeout=None):
+        self._ready.wait(timeout)
+        return self.status == "ready"
+
+    def health(self):
+        health = {
+            "status": self.status,
+            "ready": self.status == "ready",
+            "uptime": round(time.time() - self.started_at, 3),
+            "load_seconds": None if self.load_seconds is None else round(self.load_seconds, 3),
+            "requests_served": self.requests_served
+        }
+        if self.resources is not None:
+            health["corpora"] = {name: len(corpus["valid_sections"])
+                                 for name, corpus in self.resources["corpora"].items()}
+            health["model"] = self.resources["model_name"]
+            health["retrieval"] = self.resources["retrieval"]
+            health["index"] = self.resources["index"]
+            health["load_metrics"] = self.resources["load_metrics"]
+            health["query_cache"] = self.resources["query_cache"].stats()
+            if self.resources.get("cascade"):
+                health["cascade"] = app.cascade_stats(self.resources)
+        if self.batcher is not None:
+            health["micro_batch"] = self.batcher.stats()
+        if self.error:
+            health["error"] = self.error
+        return health
+
+    def find_ipc_section(self, scenario, top_k=3, timeout=None, corpora=None, with_metrics=False, neighbours=0):
+        if not self.wait_until_ready(timeout):
+            return {"error": f"Service not ready ({self.status})."}
+        if self.batcher is not None:
+            future = asyncio.run_coroutine_threadsafe(
+                self.batcher.submit(scenario, top_k, corpora, with_metrics, neighbours), self._batch_loop)
+            result = future.result()
+            with self._lock:
+                self.requests_served += 1
+            return result
+        with self._lock:
+            result = app.match_scenario(scenario, self.resources, top_k, corpora, with_metrics, neighbours)
+            self.requests_served += 1
+        return result
+
+    def lookup(self, section=None, chapter=None, timeout=None, corpora=None):
+        if not self.wait_until_ready(timeout):
+            return {"error": f"Service not ready ({self.status})."}
+        with self._lock:
+            self.requests_served += 1
+        return app.lookup_sections(self.resources, section, chapter, corpora)
+
+    # Dispatch one decoded JSON request and build the JSON-serializable reply
+    def handle(self, request):
+        if not isinstance(request, dict):
+            return {"error": "Request must be a JSON object."}
+        op = request.get("op", "find")
+        if op == "health":
+            response = self.health()
+        elif op == "find" and not isinstance(request.get("scenario", ""), str):
+            response = {"error": "'scenario' must be a string."}
+        elif op == "find":
+            response = self.find_ipc_section(request.get("scenario", ""),
+                                             int(request.get("top_k", 3)),
+                                             request.get("timeout"),
+                                             request.get("corpora"),
+                                             bool(request.get("metrics")),
+                                             int(request.get("neighbours", 0)))
+        elif op in ("section", "chapter"):
+            if request.get(op) is None:
+                response = {"error": f"Missing '{op}'."}
+            else:
+                response = self.lookup(**{op: request[op]}, timeout=request.get("timeout"),
+                                       corpora=request.get("corpora"))
+        elif op == "metrics":
+            if request.get("format") == "prometheus":
+                response = {"prometheus": app.METRICS.prometheus_text()}
+            else:
+                response = app.METRICS.snapshot()
+        else:
+            response = {"error": f"Unknown op '{op}'."}
+        if "id" in request:
+            response["id"] = request["id"]
+        return response
+
+    def handle_line(self, line):
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError:
+            return {"error": "Invalid JSON request."}
+        try:
+            return self.handle(request)
+        except (TypeError, ValueError) as e:
+            return {"error": str(e)}
+
+# Line-delimited JSON over TCP: one request per line, one response per line
+class _LineHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for raw in self.rfile:
+            line = raw.decode('utf-8').strip()
+            if not line:
+                continue
+            response = self.server.service.handle_line(line)
+            self.wfile.write((json.dumps(response) + "\n").encode('utf-8'))
+            self.wfile.flush()
+
+class _ThreadingServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+def serve_socket(service, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    with _ThreadingServer((host, port), _LineHandler) as server:
+        server.service = service
+        print(f"IPC service listening on {host}:{port}", file=sys.stderr)
+        server.serve_forever()
+
+def serve_stdio(service, stdin=sys.stdin, stdout=sys.stdout):
+    for line in stdin:
+        line = line.strip()
+        if not line:
+            continue
+        stdout.write(json.dumps(service.handle_line(line)) + "\n")
+        stdout.flush()
+
+# Thin client the game can use to talk to a running service
+class IPCClient:
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=30.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+    def request(self, payload):
+        with socket.create_connection((self.host, self.port), timeout=self.timeout) as sock:
+            sock.sendall((json.dumps(payload) + "\n").encode('utf-8'))
+            with sock.makefile('r', encoding='utf-8') as reader:
+                line = reader.readline()
+        if not line:
+            raise ConnectionError("IPC service closed the connection without replying.")
+        return json.loads(line)
+
+    def health(self):
+        return self.request({"op": "health"})
+
+    def wait_until_ready(self, timeout=120.0, interval=0.5):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                health = self.health()
+                if health.get("ready"):
+                    return True
+                if health.get("status") == "error":
+                    return False
+            except OSError:
+                pass
+            time.sleep(interval)
+        return False
+
+    def metrics(self, prometheus=False):
+        return self.request({"op": "metrics", "format": "prometheus" if prometheus else "json"})
+
+    def find_ipc_section(self, scenario, top_k=3, corpora=None, with_metrics=False, neighbours=0):
+        payload = {"op": "find", "scenario": scenario, "top_k": top_k, "metrics": with_metrics,
+                   "neighbours": neighbours}
+        if corpora:
+            payload["corpora"] = list(corpora)
+        return self.request(payload)
+
+    def lookup_section(self, section, corpora=None):
+        payload = {"op": "section", "section": section}
+        if corpora:
+            payload["corpora"] = list(corpora)
+        return self.request(payload)
+
+    def lookup_chapter(self, chapter, corpora=None):
+        payload = {"op": "chapter", "chapter": chapter}
+        if corpora:
+            payload["corpora"] = list(corpora)
+        return self.request(payload)
+
+def main():
+    parser = argparse.ArgumentParser(description='Warm IPC section lookup service')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    serve = sub.add_parser('serve', help='Load the corpus once and answer requests')
+    serve.add_argument('--stdio', action='store_true', help='Read JSON requests from stdin instead of a socket')
+    serve.add_argument('--host', default=DEFAULT_HOST)
+    serve.add_argument('--port', type=int, default=DEFAULT_PORT)
+    serve.add_argument('--micro-batch', action='store_true',
+                       help='Batch concurrent find requests into shared encode/score calls')
+    serve.add_argument('--max-batch-size', type=int, default=MAX_BATCH_SIZE, help='Most requests per batch')
+    serve.add_argument('--max-wait-ms', type=float, default=MAX_WAIT_MS,
+                       help='How long a request may wait for others to join its batch')
+    app.add_resource_arguments(serve)
+
+    query = sub.add_parser('query', help='Ask a running service for matching sections')
+    query.add_argument('scenario')
+    query.add_argument('--top-k', type=int, default=3)
+    query.add_argument('--corpus', action='append', help='Corpus name to search (repeatable; default: all)')
+    query.add_argument('--neighbours', type=int, default=0,
+                       help='Nearest sections to add per section the scenario names explicitly')
+    query.add_argument('--host', default=DEFAULT_HOST)
+    query.add_argument('--port', type=int, default=DEFAULT_PORT)
+
+    health = sub.add_parser('health', help='Report whether a running service is warm')
+    health.add_argument('--host', default=DEFAULT_HOST)
+    health.add_argument('--port', type=int, default=DEFAULT_PORT)
+    health.add_argument('--wait', type=float, default=0, help='Seconds to wait for readiness')
+
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        service = IPCService(micro_batch=args.micro_batch, max_batch_size=args.max_batch_size,
+                             max_wait_ms=args.max_wait_ms, **app.resource_options(args))
+        service.start()
+        if args.stdio:
+            serve_stdio(service)
+        else:
+            serve_socket(service, args.host, args.port)
+        return
+
+    client = IPCClient(args.host, args.port)
+    try:
+        if args.command == 'query':
+            print(json.dumps(client.find_ipc_section(args.scenario, args.top_k, args.corpus,
+                                                     neighbours=args.neighbours)))
+        else:
+            if args.wait:
+                client.wait_until_ready(args.wait)
+            result = client.health()
+            print(json.dumps(result))
+            sys.exit(0 if result.get("ready") else 1)
+    except OSError as e:
+        print(json.dumps({"error": f"IPC service unavailable: {e}"}))
+        sys.exit(2)
+
+if __name__ == "__main__":
+    main()
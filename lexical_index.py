@@ -0,0 +1,42 @@
+import math
+from collections import Counter, defaultdict
+
+import numpy as np
+
+# Okapi BM25 over pre-tokenized documents, stored as an inverted index of numpy posting arrays
+class BM25Index:
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.num_docs = len(documents)
+        lengths = np.array([len(tokens) for tokens in documents], dtype=np.float32)
+        avg_length = float(lengths.mean()) if self.num_docs else 0.0
+        norm = k1 * (1 - b + b * lengths / avg_length) if avg_length else np.full(self.num_docs, k1, dtype=np.float32)
+
+        postings = defaultdict(lambda: ([], []))
+        for doc_id, tokens in enumerate(documents):
+            for term, tf in Counter(tokens).items():
+                postings[term][0].append(doc_id)
+                postings[term][1].append(tf)
+
+        # Per-term doc ids and precomputed BM25 weights, so a query only touches its own postings
+        self.postings = {}
+        for term, (doc_ids, tfs) in postings.items():
+            doc_ids = np.array(doc_ids, dtype=np.int32)
+            tfs = np.array(tfs, dtype=np.float32)
+            idf = math.log(1 + (self.num_docs - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+            weights = idf * tfs * (k1 + 1) / (tfs + norm[doc_ids])
+            self.postings[term] = (doc_ids, weights.astype(np.float32))
+
+    # Top candidate doc ids and their BM25 scores for one tokenized query, best first
+    def search(self, tokens, limit=100):
+        scores = np.zeros(self.num_docs, dtype=np.float32)
+        for term in set(tokens):
+            posting = self.postings.get(term)
+            if posting is not None:
+                scores[posting[0]] += posting[1]
+        hits = np.flatnonzero(scores)
+        if len(hits) > limit:
+            hits = hits[np.argpartition(-scores[hits], limit - 1)[:limit]]
+        hits = hits[np.argsort(-scores[hits], kind='stable')]
+        return hits, scores[hits]
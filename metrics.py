@@ -0,0 +1,113 @@
+import contextvars
+import json
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger('ipc.metrics')
+
+# The trace of the request currently being served, if any. A context variable keeps traces
+# separate across service threads and asyncio tasks without threading them through every call.
+_current_trace = contextvars.ContextVar('ipc_trace', default=None)
+
+# Process-wide stage timings and counters for the IPC matching pipeline. Every observation is
+# aggregated here and, when a trace is active, also recorded on that trace.
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.stages = {}  # name -> [count, total seconds, max seconds]
+
+    @contextmanager
+    def stage(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t0)
+
+    def observe(self, name, seconds):
+        with self._lock:
+            stats = self.stages.setdefault(name, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+        current = _current_trace.get()
+        if current is not None:
+            current["stages"][name] = current["stages"].get(name, 0.0) + seconds
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        current = _current_trace.get()
+        if current is not None:
+            current["counters"][name] = current["counters"].get(name, 0) + value
+
+    # Attach a non-numeric detail (e.g. which fallback model loaded) to the current trace only
+    def note(self, name, value):
+        current = _current_trace.get()
+        if current is not None:
+            current["notes"][name] = value
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "stages": {name: {"count": count, "seconds": round(total, 6), "max_seconds": round(peak, 6)}
+                           for name, (count, total, peak) in self.stages.items()}
+            }
+
+    # Prometheus text exposition format
+    def prometheus_text(self, prefix='ipc'):
+        snapshot = self.snapshot()
+        lines = []
+        for name, value in sorted(snapshot["counters"].items()):
+            metric = f"{prefix}_{_metric_name(name)}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+        if snapshot["stages"]:
+            lines.append(f"# TYPE {prefix}_stage_seconds summary")
+            for name, stats in sorted(snapshot["stages"].items()):
+                lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {stats["seconds"]}')
+                lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {stats["count"]}')
+            lines.append(f"# TYPE {prefix}_stage_seconds_max gauge")
+            for name, stats in sorted(snapshot["stages"].items()):
+                lines.append(f'{prefix}_stage_seconds_max{{stage="{name}"}} {stats["max_seconds"]}')
+        return "\n".join(lines) + "\n"
+
+def _metric_name(name):
+    return re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+METRICS = Metrics()
+
+# Collect the stages, counters and notes recorded while the block runs
+@contextmanager
+def trace():
+    current = {"stages": {}, "counters": {}, "notes": {}}
+    token = _current_trace.set(current)
+    try:
+        yield current
+    finally:
+        _current_trace.reset(token)
+
+# Emit one trace as a structured JSON log line on the 'ipc.metrics' logger
+def log_trace(event, current, **fields):
+    if logger.isEnabledFor(logging.INFO):
+        record = {"event": event, **fields,
+                  "stages": {name: round(seconds, 6) for name, seconds in current["stages"].items()},
+                  "counters": current["counters"], "notes": current["notes"]}
+        logger.info(json.dumps(record, default=str))
+
+# Send structured metric logs to a file ('-' for stderr)
+def configure_metrics_log(path):
+    handler = logging.StreamHandler() if path == '-' else logging.FileHandler(path, encoding='utf-8')
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
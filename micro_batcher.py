@@ -0,0 +1,158 @@
+import asyncio
+import time
+
+import app
+from metrics import METRICS
+
+# Defaults: most scenarios answered by one match_scenarios call, and how long the first queued
+# request waits for others to join its batch
+MAX_BATCH_SIZE = 32
+MAX_WAIT_MS = 5.0
+
+# Dynamic micro-batching for concurrent lookups. Requests queue up until max_batch_size of them
+# are waiting or the oldest has waited max_wait_ms; the batch is then encoded and scored together
+# in a worker thread (one match_scenarios call per distinct top_k / corpora / metrics / neighbours
+# combination), and each caller's future is resolved with its own result. Requests arriving while
+# a batch is being scored form the next batch, so batches grow with load. Invalid scenarios are
+# answered without queueing, and if a group fails it is retried one request at a time so only the
+# request that caused the error sees it.
+class MicroBatcher:
+    def __init__(self, resources, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS, executor=None):
+        self.resources = resources
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.executor = executor
+        self.batches = 0
+        self.requests = 0
+        self.max_batch_seen = 0
+        self.batch_sizes = {}  # batch size -> number of batches of that size
+        self._pending = []
+        self._wakeup = None
+        self._full = None
+        self._worker = None
+
+    async def start(self):
+        if self._worker is None:
+            self._wakeup = asyncio.Event()
+            self._full = asyncio.Event()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    # Stop the worker; requests still queued fail with CancelledError
+    async def close(self):
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        for *_, future in self._pending:
+            if not future.done():
+                future.cancel()
+        self._pending.clear()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    # Queue one scenario and wait for its result (same shape as app.match_scenario)
+    async def submit(self, scenario, top_k=3, corpora=None, with_metrics=False, neighbours=0):
+        invalid, _ = app.validate_scenarios([scenario])
+        if invalid[0] is not None:
+            return invalid[0]
+        await self.start()
+        future = asyncio.get_running_loop().create_future()
+        key = (top_k, tuple(corpora) if corpora else None, with_metrics, neighbours)
+        self._pending.append((scenario, key, time.perf_counter(), future))
+        self._wakeup.set()
+        if len(self._pending) >= self.max_batch_size:
+            self._full.set()
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wakeup.wait()
+            # Wait out what is left of the oldest request's window; requests that queued while the
+            # previous batch was scored may already be past it
+            remaining = self._pending[0][2] + self.max_wait - time.perf_counter() if self._pending else 0
+            if len(self._pending) < self.max_batch_size and remaining > 0:
+                try:
+                    await asyncio.wait_for(self._full.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+            batch = self._pending[:self.max_batch_size]
+            del self._pending[:self.max_batch_size]
+            if not self._pending:
+                self._wakeup.clear()
+            if len(self._pending) < self.max_batch_size:
+                self._full.clear()
+            batch = [request for request in batch if not request[-1].done()]  # Skip callers that gave up
+            if not batch:
+                continue
+
+            self._record(batch)
+            try:
+                results = await loop.run_in_executor(self.executor, self._match, batch)
+            except Exception as e:
+                for *_, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (*_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def _record(self, batch):
+        now = time.perf_counter()
+        for _, _, queued_at, _ in batch:
+            METRICS.observe('microbatch_queue_wait', now - queued_at)
+        METRICS.inc('microbatch_batches')
+        METRICS.inc('microbatch_requests', len(batch))
+        self.batches += 1
+        self.requests += len(batch)
+        self.max_batch_seen = max(self.max_batch_seen, len(batch))
+        self.batch_sizes[len(batch)] = self.batch_sizes.get(len(batch), 0) + 1
+
+    # Runs in the executor: one match_scenarios call per group of compatible requests. A request
+    # whose retry still fails gets its exception in place of a result.
+    def _match(self, batch):
+        groups = {}
+        for row, (_, key, _, _) in enumerate(batch):
+            groups.setdefault(key, []).append(row)
+        results = [None] * len(batch)
+        for (top_k, corpora, with_metrics, neighbours), rows in groups.items():
+            match = lambda scenarios: app.match_scenarios(scenarios, self.resources, top_k, corpora,
+                                                          with_metrics, neighbours)
+            try:
+                matched = match([batch[row][0] for row in rows])
+            except Exception:
+                METRICS.inc('microbatch_group_retries')
+                matched = []
+                for row in rows:
+                    try:
+                        matched.append(match([batch[row][0]])[0])
+                    except Exception as e:
+                        matched.append(e)
+            for row, result in zip(rows, matched):
+                results[row] = result
+        return results
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "requests": self.requests,
+            "mean_batch_size": round(self.requests / self.batches, 3) if self.batches else 0.0,
+            "largest_batch": self.max_batch_seen,
+            "batch_sizes": {str(size): count for size, count in sorted(self.batch_sizes.items())}
+        }
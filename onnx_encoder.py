@@ -0,0 +1,195 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+ONNX_DIR = 'onnx_models'
+
+# Files written by export_onnx into <ONNX_DIR>/<model>/
+FP32_FILE = 'model.onnx'
+INT8_FILE = 'model.int8.onnx'
+CONFIG_FILE = 'encoder_config.json'
+
+def onnx_model_dir(model_name, onnx_dir=ONNX_DIR):
+    return os.path.join(onnx_dir, model_name.replace('/', '_'))
+
+# Export the transformer of a sentence-transformers model to ONNX and quantize its weights to int8.
+# Needs torch, sentence_transformers and onnxruntime once; afterwards OnnxEncoder runs without torch.
+def export_onnx(model_name, onnx_dir=ONNX_DIR, opset=14):
+    import app
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    st_model = SentenceTransformer(model_name)
+    transformer, pooling = st_model[0], st_model[1]
+    out_dir = onnx_model_dir(model_name, onnx_dir)
+    os.makedirs(out_dir, exist_ok=True)
+
+    # Export only the token embeddings; pooling and normalization are cheap and done in NumPy
+    class _TokenEmbeddings(torch.nn.Module):
+        def __init__(self, auto_model):
+            super().__init__()
+            self.auto_model = auto_model
+
+        def forward(self, input_ids, attention_mask):
+            return self.auto_model(input_ids=input_ids, attention_mask=attention_mask)[0]
+
+    sample = transformer.tokenizer(["export sample"], return_tensors='pt')
+    fp32_path = os.path.join(out_dir, FP32_FILE)
+    with torch.inference_mode():
+        torch.onnx.export(
+            _TokenEmbeddings(transformer.auto_model).eval(),
+            (sample['input_ids'], sample['attention_mask']),
+            fp32_path,
+            input_names=['input_ids', 'attention_mask'],
+            output_names=['token_embeddings'],
+            dynamic_axes={'input_ids': {0: 'batch', 1: 'sequence'},
+                          'attention_mask': {0: 'batch', 1: 'sequence'},
+                          'token_embeddings': {0: 'batch', 1: 'sequence'}},
+            opset_version=opset
+        )
+    quantize_dynamic(fp32_path, os.path.join(out_dir, INT8_FILE), weight_type=QuantType.QInt8)
+
+    transformer.tokenizer.save_pretrained(out_dir)
+    config = {
+        "model": model_name,
+        "dimension": st_model.get_sentence_embedding_dimension(),
+        "max_seq_length": st_model.max_seq_length,
+        "pooling": "cls" if pooling.pooling_mode_cls_token else "mean",
+        "normalize": any(type(module).__name__ == 'Normalize' for module in st_model),
+        "revision": app.model_revision(model_name)
+    }
+    with open(os.path.join(out_dir, CONFIG_FILE), 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2)
+    return out_dir
+
+# Drop-in replacement for the SentenceTransformer methods app.py uses (encode and
+# get_sentence_embedding_dimension), running the exported model under ONNX Runtime on CPU
+class OnnxEncoder:
+    def __init__(self, model_dir, quantized=True, threads=None):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        with open(os.path.join(model_dir, CONFIG_FILE), 'r', encoding='utf-8') as f:
+            self.config = json.load(f)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.max_seq_length = self.config["max_seq_length"]
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        path = os.path.join(model_dir, INT8_FILE if quantized else FP32_FILE)
+        self.session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+
+    def get_sentence_embedding_dimension(self):
+        return self.config["dimension"]
+
+    def _embed(self, texts):
+        inputs = self.tokenizer(texts, padding=True, truncation=True, max_length=self.max_seq_length,
+                                return_tensors='np')
+        mask = inputs['attention_mask'].astype(np.int64)
+        tokens = self.session.run(None, {'input_ids': inputs['input_ids'].astype(np.int64),
+                                         'attention_mask': mask})[0]
+        if self.config["pooling"] == "cls":
+            return tokens[:, 0]
+        weights = mask[:, :, None].astype(np.float32)
+        return (tokens * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+
+    def encode(self, sentences, batch_size=32, show_progress_bar=False, convert_to_numpy=True,
+               normalize_embeddings=False):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        out = np.zeros((len(texts), self.get_sentence_embedding_dimension()), dtype=np.float32)
+        # Length-sorted batches keep padding (and wasted compute) to a minimum
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        for start in range(0, len(order), batch_size):
+            rows = order[start:start + batch_size]
+            out[rows] = self._embed([texts[i] for i in rows])
+        if self.config["normalize"] or normalize_embeddings:
+            norms = np.linalg.norm(out, axis=1, keepdims=True)
+            out /= np.clip(norms, 1e-12, None)
+        return out[0] if single else out
+
+# Revision of an exported model: that of the weights it was exported from, or a fingerprint of the
+# export folder for exports made before the revision was recorded. None if it has not been exported.
+def onnx_revision(model_name, onnx_dir=ONNX_DIR):
+    import app
+
+    model_dir = onnx_model_dir(model_name, onnx_dir)
+    try:
+        with open(os.path.join(model_dir, CONFIG_FILE), 'r', encoding='utf-8') as f:
+            revision = json.load(f).get("revision")
+    except (OSError, ValueError):
+        return None
+    return revision or app.folder_fingerprint(model_dir)
+
+# Load the ONNX encoder for a model, exporting and quantizing it first if it is not on disk yet
+def load_onnx_encoder(model_name, onnx_dir=ONNX_DIR, quantized=True, threads=None):
+    model_dir = onnx_model_dir(model_name, onnx_dir)
+    if not os.path.exists(os.path.join(model_dir, INT8_FILE if quantized else FP32_FILE)):
+        export_onnx(model_name, onnx_dir)
+    return OnnxEncoder(model_dir, quantized, threads)
+
+# Top-k agreement between the PyTorch and ONNX backends when retrieving over the IPC corpus
+def parity_check(model_name, filename='ipc.json', top_k=3, threads=None, onnx_dir=ONNX_DIR):
+    import app
+    from sentence_transformers import SentenceTransformer
+
+    texts, valid_sections = app.prepare_data(app.load_ipc_data(filename))
+    # Section titles, augmented like player scenarios, serve as queries
+    queries = [app.augment_input(section.get('section_title', '')) for section in valid_sections]
+
+    backends = {"torch": SentenceTransformer(model_name),
+                "onnx": load_onnx_encoder(model_name, onnx_dir, True, threads)}
+    ranked = {}
+    timings = {}
+    vectors = {}
+    for name, encoder in backends.items():
+        corpus = app.normalize_rows(encoder.encode(texts, convert_to_numpy=True))
+        t0 = time.perf_counter()
+        query_vecs = np.stack([encoder.encode([q], convert_to_numpy=True, normalize_embeddings=True)[0]
+                               for q in queries[:100]])
+        timings[name] = (time.perf_counter() - t0) / len(query_vecs)
+        query_vecs = encoder.encode(queries, convert_to_numpy=True, normalize_embeddings=True)
+        ranked[name] = app.top_k_indices(query_vecs @ corpus.T, top_k)
+        vectors[name] = corpus
+
+    overlap = [len(set(a) & set(b)) / top_k for a, b in zip(ranked["torch"], ranked["onnx"])]
+    return {
+        "model": model_name,
+        "queries": len(queries),
+        "top_k": top_k,
+        "top1_agreement": float(np.mean(ranked["torch"][:, 0] == ranked["onnx"][:, 0])),
+        "topk_overlap": float(np.mean(overlap)),
+        "mean_corpus_cosine": float(np.mean(np.sum(vectors["torch"] * vectors["onnx"], axis=1))),
+        "query_latency_ms": {name: round(seconds * 1000, 3) for name, seconds in timings.items()}
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='ONNX Runtime int8 encoder backend')
+    sub = parser.add_subparsers(dest='command', required=True)
+    export = sub.add_parser('export', help='Export and quantize a sentence-transformers model')
+    export.add_argument('--model', default='all-mpnet-base-v2')
+    export.add_argument('--onnx-dir', default=ONNX_DIR)
+    parity = sub.add_parser('parity', help='Compare ONNX and PyTorch top-k results on the IPC corpus')
+    parity.add_argument('--model', default='all-mpnet-base-v2')
+    parity.add_argument('--data', default='ipc.json')
+    parity.add_argument('--top-k', type=int, default=3)
+    parity.add_argument('--threads', type=int)
+    parity.add_argument('--onnx-dir', default=ONNX_DIR)
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        print(f"Exported to {export_onnx(args.model, args.onnx_dir)}")
+    else:
+        report = parity_check(args.model, args.data, args.top_k, args.threads, args.onnx_dir)
+        print(json.dumps(report, indent=2))
+        sys.exit(0 if report["topk_overlap"] >= 0.9 else 1)
+
+if __name__ == "__main__":
+    main()
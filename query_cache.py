@@ -0,0 +1,99 @@
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Two-tier cache of query embeddings keyed on (model id, augmented scenario text):
+# a bounded in-process LRU for the hot set and an optional SQLite file that survives restarts.
+# The model id should change whenever the weights do (see app.open_query_cache); stored vectors
+# whose length differs from `dimension`, when given, are ignored.
+class QueryCache:
+    def __init__(self, model_name, capacity=1024, db_path=None, dimension=None):
+        self.model_name = model_name
+        self.dimension = dimension
+        self.capacity = capacity
+        self.db_path = db_path
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if db_path:
+            os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                "model TEXT NOT NULL, query TEXT NOT NULL, dimension INTEGER NOT NULL, "
+                "vector BLOB NOT NULL, PRIMARY KEY (model, query))"
+            )
+            self._db.commit()
+
+    def _remember(self, query, vector):
+        self._memory[query] = vector
+        self._memory.move_to_end(query)
+        while len(self._memory) > self.capacity:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    # Look up many queries at once; returns {query: vector} for the ones found in either tier
+    def get_many(self, queries):
+        found = {}
+        with self._lock:
+            pending = []
+            for query in dict.fromkeys(queries):
+                if query in self._memory:
+                    self._memory.move_to_end(query)
+                    found[query] = self._memory[query]
+                    self.memory_hits += 1
+                else:
+                    pending.append(query)
+            if pending and self._db is not None:
+                for query in pending:
+                    row = self._db.execute(
+                        "SELECT dimension, vector FROM query_embeddings WHERE model = ? AND query = ?",
+                        (self.model_name, query)
+                    ).fetchone()
+                    if row is None:
+                        continue
+                    vector = np.frombuffer(row[1], dtype=np.float32)
+                    if vector.shape[0] != row[0] or (self.dimension is not None and row[0] != self.dimension):
+                        continue
+                    found[query] = vector
+                    self._remember(query, vector)
+                    self.disk_hits += 1
+            self.misses += sum(1 for query in pending if query not in found)
+        return found
+
+    def put_many(self, items):
+        items = [(query, np.asarray(vector, dtype=np.float32)) for query, vector in items]
+        with self._lock:
+            for query, vector in items:
+                self._remember(query, vector)
+            if self._db is not None and items:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO query_embeddings (model, query, dimension, vector) VALUES (?, ?, ?, ?)",
+                    [(self.model_name, query, int(vector.shape[0]), vector.tobytes()) for query, vector in items]
+                )
+                self._db.commit()
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "memory_size": len(self._memory),
+            "capacity": self.capacity,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0
+        }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,66 @@
+import json
+import re
+
+# A pattern made only of words and spaces can join the combined literal matcher;
+# anything else (character classes, anchors, ...) is kept as its own regex
+_LITERAL_TERM = re.compile(r'^[\w ]+$')
+
+# Keyword rules compiled once into a single matcher. Literal terms from every rule share one
+# lookahead alternation, so a single finditer pass over the text reports every rule whose term
+# occurs anywhere in it - the same substring semantics as running re.search once per rule.
+class QueryRules:
+    def __init__(self, rules, stop_words=None):
+        # rules: list of (name, pattern, legal_terms) where pattern is a '|'-separated alternation
+        self.names = [name for name, _, _ in rules]
+        self.legal_terms = [legal_terms for _, _, legal_terms in rules]
+        self.stop_words = list(stop_words) if stop_words else None
+
+        term_rules = {}
+        self.regex_rules = []
+        for index, (_, pattern, _) in enumerate(rules):
+            terms = [term.strip().lower() for term in pattern.split('|')]
+            if all(term and _LITERAL_TERM.match(term) for term in terms):
+                for term in terms:
+                    term_rules.setdefault(term, set()).add(index)
+            else:
+                self.regex_rules.append((index, re.compile(pattern, re.IGNORECASE)))
+
+        # The alternation reports only the longest term starting at each position, so each
+        # term also fires the rules of every shorter term it contains
+        terms = sorted(term_rules, key=len, reverse=True)
+        self.term_rules = {
+            term: frozenset().union(*(term_rules[other] for other in terms if other in term))
+            for term in terms
+        }
+        self.pattern = None
+        if terms:
+            alternation = '|'.join(re.escape(term) for term in terms)
+            self.pattern = re.compile(f'(?=({alternation}))', re.IGNORECASE)
+
+    @classmethod
+    def from_keyword_map(cls, keyword_map, stop_words=None):
+        rules = [(pattern.split('|')[0], pattern, legal_terms) for pattern, legal_terms in keyword_map.items()]
+        return cls(rules, stop_words)
+
+    # Rules file format: {"rules": [{"name": ..., "match": "theft|stole", "terms": "..."}], "stop_words": [...]}
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        rules = []
+        for i, rule in enumerate(config.get('rules', [])):
+            if not rule.get('match') or not rule.get('terms'):
+                raise ValueError(f"Rule {i} in '{path}' needs non-empty 'match' and 'terms'.")
+            rules.append((rule.get('name') or rule['match'].split('|')[0], rule['match'], rule['terms']))
+        return cls(rules, config.get('stop_words'))
+
+    # Indices of the rules that fire on text, in rule order
+    def match(self, text):
+        fired = set()
+        if self.pattern is not None:
+            for m in self.pattern.finditer(text):
+                fired |= self.term_rules[m.group(1).lower()]
+        for index, regex in self.regex_rules:
+            if index not in fired and regex.search(text):
+                fired.add(index)
+        return sorted(fired)
@@ -0,0 +1,221 @@
+import math
+
+import numpy as np
+
+from metrics import METRICS
+
+# Indices of the k highest scores in each row, best first, without sorting whole rows
+def top_k_indices(scores, top_k):
+    n = scores.shape[1]
+    top_k = max(1, min(top_k, n))
+    if top_k < n:
+        candidates = np.argpartition(scores, n - top_k, axis=1)[:, n - top_k:]
+    else:
+        candidates = np.broadcast_to(np.arange(n), scores.shape)
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind='stable')
+    return np.take_along_axis(candidates, order, axis=1)
+
+# Exact scores of the given rows for every query, shape (queries, len(ids))
+def _score_rows(vectors, queries, ids):
+    scores = np.asarray(queries @ vectors[ids].T)
+    METRICS.inc('vectors_scored', scores.size)
+    return scores
+
+# Exact search: one matrix multiply against every stored (L2-normalized) vector
+class FlatIndex:
+    kind = 'flat'
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    # Returns one (ids, scores) pair per query, best first
+    def search(self, queries, top_k):
+        scores = np.asarray(queries @ self.vectors.T)
+        METRICS.inc('vectors_scored', scores.size)
+        top = top_k_indices(scores, top_k)
+        return [(ids, np.take(row, ids)) for ids, row in zip(top, scores)]
+
+    def score(self, queries, ids):
+        return _score_rows(self.vectors, queries, ids)
+
+# Inverted-file index: spherical k-means splits the vectors into nlist cells and a query only
+# scores the vectors in its nprobe closest cells. Raising nprobe trades latency for recall;
+# nprobe == nlist is exact search.
+class IVFIndex:
+    kind = 'ivf'
+
+    def __init__(self, vectors, nlist=None, nprobe=8, iterations=10, seed=0):
+        self.vectors = vectors
+        n = vectors.shape[0]
+        self.nlist = max(1, min(nlist or int(round(math.sqrt(n))), n))
+        self.nprobe = nprobe
+
+        data = np.asarray(vectors, dtype=np.float32)
+        rng = np.random.default_rng(seed)
+        centroids = data[rng.choice(n, self.nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign = np.argmax(data @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, data)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            filled = norms[:, 0] > 0  # Empty cells keep their previous centroid
+            centroids[filled] = sums[filled] / norms[filled]
+        assign = np.argmax(data @ centroids.T, axis=1)
+
+        # Cell members stored contiguously: ids[offsets[c]:offsets[c + 1]] belong to cell c
+        self.centroids = centroids
+        self.ids = np.argsort(assign, kind='stable').astype(np.int64)
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=self.nlist))])
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    def search(self, queries, top_k, nprobe=None):
+        nprobe = max(1, min(nprobe or self.nprobe, self.nlist))
+        probes = top_k_indices(np.asarray(queries @ self.centroids.T), nprobe)
+        results = []
+        for query, cells in zip(queries, probes):
+            ids = np.concatenate([self.ids[self.offsets[c]:self.offsets[c + 1]] for c in cells])
+            if len(ids) < top_k:  # Too few vectors in the probed cells; search everything
+                ids = np.arange(len(self))
+            scores = np.asarray(self.vectors[ids] @ query)
+            METRICS.inc('vectors_scored', len(ids))
+            order = top_k_indices(scores[None, :], top_k)[0]
+            results.append((ids[order], scores[order]))
+        return results
+
+    def score(self, queries, ids):
+        return _score_rows(self.vectors, queries, ids)
+
+# Several vectors per item (e.g. overlapping segments of a long section), stored contiguously:
+# rows offsets[i]:offsets[i + 1] belong to item i. An item scores as its best segment ('max')
+# or the mean of its top_m segments ('mean'); both are computed for all items at once.
+class MultiVectorIndex:
+    kind = 'multi'
+
+    def __init__(self, vectors, offsets, pooling='max', top_m=2):
+        if pooling not in ('max', 'mean'):
+            raise ValueError(f"Unknown segment pooling '{pooling}'.")
+        self.vectors = vectors
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.counts = np.diff(self.offsets)
+        if len(self.counts) and self.counts.min() < 1:
+            raise ValueError("Every item needs at least one vector.")
+        self.pooling = pooling
+        self.top_m = max(1, top_m)
+
+    def __len__(self):
+        return len(self.counts)
+
+    # Pool segment scores (queries, segments) into item scores; item i owns columns starts[i]:starts[i] + counts[i]
+    def _pool(self, scores, starts, counts):
+        if self.pooling == 'max':
+            return np.maximum.reduceat(scores, starts, axis=1)
+        width = int(counts.max())
+        valid = np.arange(width) < counts[:, None]
+        slots = np.where(valid, starts[:, None] + np.arange(width), 0)
+        gathered = np.where(valid, scores[:, slots], -np.inf)  # (queries, items, width)
+        m = min(self.top_m, width)
+        top = -np.partition(-gathered, m - 1, axis=2)[:, :, :m] if m < width else gathered
+        return np.where(np.isfinite(top), top, 0.0).sum(axis=2) / np.minimum(counts, m)
+
+    # Item scores for every query; all items, or only `ids` (in that order)
+    def score(self, queries, ids=None):
+        if ids is None:
+            segment_scores = np.asarray(queries @ self.vectors.T)
+            starts, counts = self.offsets[:-1], self.counts
+        else:
+            ids = np.asarray(ids, dtype=np.int64)
+            counts = self.counts[ids]
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64)
+            rows = np.arange(counts.sum()) - np.repeat(starts, counts) + np.repeat(self.offsets[ids], counts)
+            segment_scores = np.asarray(queries @ self.vectors[rows].T)
+        METRICS.inc('vectors_scored', segment_scores.size)
+        return self._pool(segment_scores, starts, counts)
+
+    def search(self, queries, top_k):
+        scores = self.score(queries)
+        top = top_k_indices(scores, top_k)
+        return [(ids, np.take(row, ids)) for ids, row in zip(top, scores)]
+
+# Scalar quantization choices for the first pass, and how many of its candidates are rescored exactly
+QUANTIZED_TYPES = ['int8', 'float16']
+RESCORE_CANDIDATES = 50
+
+# Rows quantized or scored per block, bounding the float32 copies made along the way
+BLOCK_ROWS = 4096
+
+# Exact search over a scalar-quantized copy: int8 codes with one scale per dimension (4x smaller) or
+# float16 (2x smaller) are scored block by block, and only the best `rescore` candidates per query
+# are rescored against the float32 vectors. Those can stay memory-mapped, since only the candidate
+# rows are ever read.
+class QuantizedIndex:
+    def __init__(self, vectors, dtype='int8', rescore=RESCORE_CANDIDATES):
+        if dtype not in QUANTIZED_TYPES:
+            raise ValueError(f"Unknown quantization '{dtype}'.")
+        self.kind = dtype
+        self.vectors = vectors
+        self.rescore = rescore
+        n, dimension = vectors.shape
+        blocks = [slice(start, start + BLOCK_ROWS) for start in range(0, n, BLOCK_ROWS)]
+        self.scale = None
+        if dtype == 'int8':
+            peak = np.zeros(dimension, dtype=np.float32)
+            for block in blocks:
+                peak = np.maximum(peak, np.abs(np.asarray(vectors[block])).max(axis=0))
+            self.scale = np.where(peak > 0, peak / 127, 1.0).astype(np.float32)
+        self.codes = np.empty((n, dimension), dtype=np.int8 if dtype == 'int8' else np.float16)
+        for block in blocks:
+            rows = np.asarray(vectors[block], dtype=np.float32)
+            self.codes[block] = np.round(rows / self.scale) if self.scale is not None else rows
+
+    def __len__(self):
+        return self.codes.shape[0]
+
+    # Bytes held in memory by the quantized copy (the float32 vectors are not counted)
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + (self.scale.nbytes if self.scale is not None else 0)
+
+    def approximate_scores(self, queries):
+        queries = np.asarray(queries, dtype=np.float32)
+        if self.scale is not None:
+            queries = queries * self.scale
+        scores = np.empty((queries.shape[0], len(self)), dtype=np.float32)
+        for start in range(0, len(self), BLOCK_ROWS):
+            scores[:, start:start + BLOCK_ROWS] = queries @ self.codes[start:start + BLOCK_ROWS].astype(np.float32).T
+        METRICS.inc('quantized_vectors_scored', scores.size)
+        return scores
+
+    # rescore=0 returns the quantized scores as they are
+    def search(self, queries, top_k, rescore=None):
+        rescore = self.rescore if rescore is None else rescore
+        approximate = self.approximate_scores(queries)
+        pools = top_k_indices(approximate, max(top_k, rescore))
+        results = []
+        for query, row, pool in zip(queries, approximate, pools):
+            if rescore:
+                pool = np.sort(pool)  # Ascending row order reads a memory-mapped store sequentially
+                scores = np.asarray(self.vectors[pool] @ query)
+                METRICS.inc('vectors_scored', len(pool))
+            else:
+                scores = row[pool]
+            order = top_k_indices(scores[None, :], top_k)[0]
+            results.append((pool[order], scores[order]))
+        return results
+
+    def score(self, queries, ids):
+        return _score_rows(self.vectors, queries, ids)
+
+def build_vector_index(vectors, kind='flat', nlist=None, nprobe=8, quantize=None, rescore=RESCORE_CANDIDATES):
+    if quantize and kind != 'flat':
+        raise ValueError(f"Quantization is only supported with the flat index, not '{kind}'.")
+    if kind == 'flat':
+        return QuantizedIndex(vectors, quantize, rescore) if quantize else FlatIndex(vectors)
+    if kind == 'ivf':
+        return IVFIndex(vectors, nlist, nprobe)
+    raise ValueError(f"Unknown vector index '{kind}'.")